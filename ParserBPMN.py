@@ -1,153 +1,480 @@
+import io
 import os
+import json
+import time
+import hashlib
 import asyncio
+import argparse
+import urllib.request
 import xml.etree.ElementTree as ET
-from playwright.async_api import async_playwright
+from concurrent.futures import ProcessPoolExecutor
 
 # РАСШИРЕННЫЙ СПИСОК КЛАССОВ (NC: 5)
 # Разделяем события, так как у них разная толщина границ и геометрия (тонкая, жирная, двойная линия)
 CLASSES = ['Task', 'Gateway', 'StartEvent', 'EndEvent', 'IntermediateEvent']
 
-async def process_bpmn_dataset(folder_path):
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <script src="https://unpkg.com/bpmn-js/dist/bpmn-viewer.production.min.js"></script>
-        <style>
-            #canvas { width: 100vw; height: 100vh; background: white; }
-            body, html { margin: 0; padding: 0; overflow: hidden; }
-            .bjs-powered-by { display: none !important; }
-        </style>
-    </head>
-    <body>
-        <div id="canvas"></div>
-        <script>
-            window.viewer = new BpmnJS({ container: '#canvas' });
-            window.getRenderData = async (xml) => {
-                try {
-                    await window.viewer.importXML(xml);
-                    const canvas = window.viewer.get('canvas');
-                    canvas.zoom('fit-viewport'); 
-                    const viewbox = canvas.viewbox();
-                    return {
-                        scale: viewbox.scale,
-                        x_offset: viewbox.x,
-                        y_offset: viewbox.y,
-                        success: true
-                    };
-                } catch (err) {
-                    return { success: false, error: err.message };
-                }
-            };
-        </script>
-    </body>
-    </html>
+IMG_W, IMG_H = 1600, 1600
+# Пул рендера: RENDER_CONTEXTS браузерных контекстов по RENDER_PAGES_PER_CONTEXT страниц в каждом
+RENDER_CONTEXTS = 2
+RENDER_PAGES_PER_CONTEXT = 4
+PROGRESS_EVERY = 50  # Как часто печатать скорость (файлов)
+# Разметка без браузера (--geometry-only): процессы и размер порции файлов на процесс
+GEOMETRY_WORKERS = os.cpu_count() or 1
+GEOMETRY_CHUNK = 64
+
+# bpmn-js берется из локального файла; если его нет — один раз скачивается с unpkg и кешируется рядом.
+# Для изолированных машин файл достаточно положить по этому пути заранее.
+VIEWER_BUNDLE_URL = "https://unpkg.com/bpmn-js/dist/bpmn-viewer.production.min.js"
+VIEWER_BUNDLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vendor', 'bpmn-viewer.production.min.js')
+# Страница и бандл отдаются браузеру из памяти через перехват запросов, сеть не нужна
+RENDER_ORIGIN = "http://bpmn-render.local"
+
+# Манифест инкрементальной генерации: хеш, размер и mtime исходника, настройки рендера и выходные файлы
+# по каждой диаграмме
+MANIFEST_NAME = '.render_manifest.json'
+
+NS = {
+    'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
+    'bpmndi': 'http://www.omg.org/spec/BPMN/20100524/DI',
+    'omgdc': 'http://www.omg.org/spec/DD/20100524/DC'
+}
+
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <script src="/bpmn-viewer.js"></script>
+    <style>
+        #canvas { width: 100vw; height: 100vh; background: white; }
+        body, html { margin: 0; padding: 0; overflow: hidden; }
+        .bjs-powered-by { display: none !important; }
+    </style>
+</head>
+<body>
+    <div id="canvas"></div>
+    <script>
+        window.viewer = new BpmnJS({ container: '#canvas' });
+        // Вместо фиксированной паузы ждем, пока браузер отрисует два кадра после импорта
+        const rendered = () => Promise.race([
+            new Promise(r => requestAnimationFrame(() => requestAnimationFrame(r))),
+            new Promise(r => setTimeout(r, 500))
+        ]);
+        window.getRenderData = async (xml) => {
+            try {
+                await window.viewer.importXML(xml);
+                const canvas = window.viewer.get('canvas');
+                canvas.zoom('fit-viewport');
+                const viewbox = canvas.viewbox();
+                await rendered();
+                return {
+                    scale: viewbox.scale,
+                    x_offset: viewbox.x,
+                    y_offset: viewbox.y,
+                    success: true
+                };
+            } catch (err) {
+                return { success: false, error: err.message };
+            }
+        };
+    </script>
+</body>
+</html>
+"""
+
+
+def bpmn_class_id(tag):
+    """Класс YOLO по тегу BPMN-элемента или -1, если элемент не размечается."""
+    # Игнорируем контейнеры и связи, чтобы модель не путалась
+    if tag in ['participant', 'lane', 'collaboration', 'textAnnotation', 'association']:
+        return -1
+
+    tag_l = tag.lower()
+
+    # 0: Tasks, Call Activities, Subprocesses (Прямоугольники)
+    if 'task' in tag_l or 'callactivity' in tag_l or 'subprocess' in tag_l:
+        return 0
+    # 1: Gateways (Ромбы)
+    elif 'gateway' in tag_l:
+        return 1
+    # 2: Start Events (Тонкий круг)
+    elif 'startevent' in tag_l:
+        return 2
+    # 3: End Events (Жирный круг)
+    elif 'endevent' in tag_l:
+        return 3
+    # 4: Intermediate / Boundary Events (Двойной круг)
+    elif 'intermediate' in tag_l or 'boundaryevent' in tag_l:
+        return 4
+    return -1
+
+
+def load_viewer_bundle(path=VIEWER_BUNDLE_PATH, url=VIEWER_BUNDLE_URL):
+    """Содержимое бандла bpmn-js: из локального файла или (один раз) скачанное по url."""
+    if not os.path.exists(path):
+        print(f"⬇️  Бандл bpmn-js не найден, скачиваем в {path}")
+        try:
+            with urllib.request.urlopen(url, timeout=30) as resp:
+                data = resp.read()
+        except OSError as e:
+            raise RuntimeError(f"Нет бандла bpmn-js ({path}) и его не удалось скачать: {e}") from e
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def _new_render_context(browser, bundle):
+    """Контекст, в котором страница и бандл отдаются из памяти; маршрут ставится один раз на контекст."""
+    context = await browser.new_context(viewport={"width": IMG_W, "height": IMG_H})
+    html = HTML_TEMPLATE.encode('utf-8')
+
+    async def serve(route):
+        if route.request.url.endswith("/bpmn-viewer.js"):
+            await route.fulfill(body=bundle, content_type="application/javascript",
+                                headers={"Cache-Control": "max-age=31536000"})
+        else:
+            await route.fulfill(body=html, content_type="text/html")
+
+    await context.route(f"{RENDER_ORIGIN}/**", serve)
+    return context
+
+
+_BPMNDI_SHAPE = '{%s}BPMNShape' % NS['bpmndi']
+_DC_BOUNDS = '{%s}Bounds' % NS['omgdc']
+_DI_WAYPOINT = '{http://www.omg.org/spec/DD/20100524/DI}waypoint'
+
+
+def extract_diagram(source):
+    """Узлы диаграммы и ее габарит за один потоковый проход.
+
+    Возвращает (узлы [(класс, x, y, w, h)] в координатах DI, габарит (x, y, w, h) или None для пустой диаграммы).
+    Габарит — объединение всех Bounds (фигуры и подписи) и точек ребер, т.е. то, что рисует bpmn-js.
+    source — путь или файловый объект. Разобранные элементы сразу удаляются из дерева,
+    поэтому память не растет с размером файла. Функция самодостаточна и годится для пула процессов.
+    """
+    min_x = min_y = float('inf')
+    max_x = max_y = float('-inf')
+    element_cls = {}  # id -> класс YOLO (только размечаемые элементы)
+    raw_shapes = []   # (bpmnElement, x, y, w, h) в порядке документа
+    stack = []
+    shape_ref = shape_bounds = None
+
+    for event, el in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(el)
+            if el.tag == _BPMNDI_SHAPE:
+                shape_ref, shape_bounds = el.get('bpmnElement'), None
+            elif (el.tag == _DC_BOUNDS and shape_bounds is None
+                  and len(stack) > 1 and stack[-2].tag == _BPMNDI_SHAPE):
+                # Только собственные Bounds фигуры, не вложенного BPMNLabel
+                shape_bounds = tuple(float(el.get(k)) for k in ('x', 'y', 'width', 'height'))
+            if el.tag == _DC_BOUNDS:
+                bx, by = float(el.get('x')), float(el.get('y'))
+                min_x, min_y = min(min_x, bx), min(min_y, by)
+                max_x, max_y = max(max_x, bx + float(el.get('width'))), max(max_y, by + float(el.get('height')))
+            elif el.tag == _DI_WAYPOINT:
+                wx, wy = float(el.get('x')), float(el.get('y'))
+                min_x, min_y, max_x, max_y = min(min_x, wx), min(min_y, wy), max(max_x, wx), max(max_y, wy)
+            el_id = el.get('id')
+            if el_id:
+                cls = bpmn_class_id(el.tag.split('}')[-1])
+                if cls != -1:
+                    element_cls[el_id] = cls
+                else:
+                    element_cls.pop(el_id, None)
+            continue
+
+        stack.pop()
+        if el.tag == _BPMNDI_SHAPE and shape_bounds is not None:
+            raw_shapes.append((shape_ref,) + shape_bounds)
+        # Разобранный элемент больше не нужен: атрибуты уже прочитаны на 'start'
+        el.clear()
+        if stack:
+            stack[-1].remove(el)
+
+    # Ссылки разрешаются в конце: элементы процесса могут идти и после BPMNDiagram
+    shapes = [(element_cls[ref], x, y, w, h) for ref, x, y, w, h in raw_shapes if ref in element_cls]
+    bbox = (min_x, min_y, max_x - min_x, max_y - min_y) if min_x <= max_x else None
+    return shapes, bbox
+
+
+def extract_shapes(source):
+    """Узлы диаграммы за один потоковый проход: список (класс, x, y, w, h) в координатах DI."""
+    return extract_diagram(source)[0]
+
+
+def fit_viewport(bbox, outer_w=IMG_W, outer_h=IMG_H):
+    """Повторяет canvas.zoom('fit-viewport') из bpmn-js: трансформация вида для габарита диаграммы bbox.
+
+    Диаграмма, целиком помещающаяся от начала координат, не масштабируется; иначе вписывается
+    без увеличения (scale <= 1) с левым верхним углом габарита в углу окна.
+    Габарит берется из DI, а не из SVG, поэтому на подписях с выходом текста за свои Bounds возможны расхождения.
+    """
+    x, y, w, h = bbox if bbox is not None else (0.0, 0.0, 0.0, 0.0)
+    if x >= 0 and y >= 0 and x + w <= outer_w and y + h <= outer_h:
+        return {'scale': 1.0, 'x_offset': 0.0, 'y_offset': 0.0, 'success': True}
+    scale = min(1.0, outer_w / w if w else 1.0, outer_h / h if h else 1.0)
+    return {'scale': scale, 'x_offset': x, 'y_offset': y, 'success': True}
+
+
+def yolo_labels(shapes, render_meta, img_w=IMG_W, img_h=IMG_H):
+    """Строки разметки YOLO для узлов extract_shapes при трансформации вида render_meta."""
+    scale, off_x, off_y = render_meta['scale'], render_meta['x_offset'], render_meta['y_offset']
+    labels = []
+    for cls, bx, by, bw, bh in shapes:
+        x = (bx - off_x) * scale
+        y = (by - off_y) * scale
+        w = bw * scale
+        h = bh * scale
+
+        cx = (x + w / 2) / img_w
+        cy = (y + h / 2) / img_h
+        nw, nh = w / img_w, h / img_h
+
+        if 0 <= cx <= 1 and 0 <= cy <= 1:
+            labels.append(f"{cls} {cx:.6f} {cy:.6f} {nw:.6f} {nh:.6f}")
+    return labels
+
+
+async def _render_one(page, folder_path, file):
+    xml_path = os.path.join(folder_path, file)
+    base_name = os.path.splitext(file)[0]
+    png_path = os.path.join(folder_path, base_name + ".png")
+    txt_path = os.path.join(folder_path, base_name + ".txt")
+
+    # Файл читается один раз: байты идут и в потоковый разбор, и в браузер
+    with open(xml_path, 'rb') as f:
+        data = f.read()
+    # Разбор XML — CPU-работа: в потоке, чтобы не держать цикл событий и остальные страницы
+    shapes = await asyncio.to_thread(extract_shapes, io.BytesIO(data))
+
+    render_meta = await page.evaluate("xml => window.getRenderData(xml)", data.decode('utf-8'))
+    if not render_meta['success']:
+        print(f"⚠️ Ошибка рендеринга {file}: {render_meta.get('error')}")
+        return False
+
+    await page.screenshot(path=png_path)
+
+    labels = yolo_labels(shapes, render_meta)
+    with open(txt_path, 'w') as f:
+        f.write("\n".join(labels))
+    print(f"✅ {file}: записано {len(labels)} узлов")
+    return True
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def render_settings(bundle):
+    """Все, от чего зависят png/txt: при смене любого поля датасет перегенерируется целиком."""
+    return {"viewport": [IMG_W, IMG_H], "classes": CLASSES, "viewer_sha256": _sha256(bundle)}
+
+
+def load_manifest(folder_path):
+    path = os.path.join(folder_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"settings": None, "files": {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(folder_path, manifest):
+    path = os.path.join(folder_path, MANIFEST_NAME)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _remove_outputs(folder_path, outputs):
+    for name in outputs:
+        try:
+            os.remove(os.path.join(folder_path, name))
+        except FileNotFoundError:
+            pass
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def plan_incremental(folder_path, files, manifest, settings):
+    """Делит диаграммы на требующие рендера и актуальные; удаляет выходы исчезнувших исходников.
+
+    Хеш пересчитывается только у файлов, чьи размер или mtime разошлись с манифестом.
+    Возвращает (список файлов для рендера, словарь file -> {"sha256", "size", "mtime_ns"}).
     """
+    entries = manifest["files"]
+    sources = {}
+    for file in files:
+        path = os.path.join(folder_path, file)
+        size, mtime_ns = _source_stamp(path)
+        entry = entries.get(file)
+        if entry is not None and entry.get("size") == size and entry.get("mtime_ns") == mtime_ns:
+            digest = entry["sha256"]
+        else:
+            with open(path, 'rb') as f:
+                digest = _sha256(f.read())
+        sources[file] = {"sha256": digest, "size": size, "mtime_ns": mtime_ns}
+
+    for file in sorted(set(entries) - set(sources)):
+        _remove_outputs(folder_path, entries.pop(file)["outputs"])
+        print(f"🗑  {file}: исходник удален, выходы убраны")
+
+    if manifest.get("settings") != settings:
+        # Сменились настройки рендера — старые записи недействительны
+        entries.clear()
+        manifest["settings"] = settings
+
+    todo = []
+    for file in files:
+        entry = entries.get(file)
+        if (entry is None or entry["sha256"] != sources[file]["sha256"]
+                or not all(os.path.exists(os.path.join(folder_path, o)) for o in entry["outputs"])):
+            todo.append(file)
+        else:
+            # Содержимое то же (например, файл только «тронули») — запоминаем новый mtime, чтобы не хешировать снова
+            entry.update(sources[file])
+    return todo, sources
 
+
+def label_from_geometry(xml_path):
+    """Разметка одного файла без браузера: вид вычисляется fit_viewport по DI. Возвращает число узлов."""
+    shapes, bbox = extract_diagram(xml_path)
+    labels = yolo_labels(shapes, fit_viewport(bbox))
+    with open(os.path.splitext(xml_path)[0] + ".txt", 'w') as f:
+        f.write("\n".join(labels))
+    return len(labels)
+
+
+def _label_chunk(paths):
+    # Порция файлов на одну задачу пула: накладные расходы на передачу между процессами не доминируют
+    results = []
+    for path in paths:
+        try:
+            label_from_geometry(path)
+            results.append((path, None))
+        except Exception as e:
+            results.append((path, str(e)))
+    return results
+
+
+def label_dataset_geometry(folder_path, workers=GEOMETRY_WORKERS):
+    """Перегенерация .txt для всех .bpmn папки без Playwright (например, после смены карты классов)."""
+    with open(os.path.join(folder_path, 'classes.txt'), 'w') as f:
+        f.write('\n'.join(CLASSES))
+
+    paths = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.endswith(".bpmn")]
+    progress = _Progress(len(paths))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_label_chunk, paths[i:i + GEOMETRY_CHUNK]) for i in range(0, len(paths), GEOMETRY_CHUNK)]
+        for future in futures:
+            for path, error in future.result():
+                if error:
+                    failed += 1
+                    print(f"❌ Ошибка {os.path.basename(path)}: {error}")
+                progress.tick()
+    print(f"✅ Размечено {len(paths) - failed} из {len(paths)} файлов")
+
+
+class _Progress:
+    def __init__(self, total):
+        self.total, self.done, self.t0 = total, 0, time.perf_counter()
+
+    def tick(self):
+        self.done += 1
+        if self.done % PROGRESS_EVERY == 0 or self.done == self.total:
+            elapsed = time.perf_counter() - self.t0
+            print(f"📊 {self.done}/{self.total} файлов, {self.done / elapsed:.1f} файлов/с")
+
+
+async def _page_worker(page, folder_path, queue, progress, manifest, sources):
+    while True:
+        try:
+            file = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        # До успешного рендера запись не считается актуальной: при сбое файл повторится в следующий запуск
+        old_entry = manifest["files"].pop(file, None)
+        base_name = os.path.splitext(file)[0]
+        outputs = [base_name + ".png", base_name + ".txt"]
+        try:
+            rendered = await _render_one(page, folder_path, file)
+        except Exception as e:
+            print(f"❌ Ошибка {file}: {e}")
+            rendered = False
+        if rendered:
+            manifest["files"][file] = dict(sources[file], outputs=outputs)
+        else:
+            # Старые (или недописанные) png/txt не должны попасть в обучающую выборку
+            _remove_outputs(folder_path, old_entry["outputs"] if old_entry else outputs)
+        progress.tick()
+        if progress.done % PROGRESS_EVERY == 0:
+            # Промежуточное сохранение: после обрыва процесса готовые файлы не рендерятся заново
+            save_manifest(folder_path, manifest)
+
+
+async def process_bpmn_dataset(folder_path, contexts=RENDER_CONTEXTS, pages_per_context=RENDER_PAGES_PER_CONTEXT,
+                               viewer_bundle=VIEWER_BUNDLE_PATH, force=False):
     # Сохраняем актуальный список классов для YOLO
     with open(os.path.join(folder_path, 'classes.txt'), 'w') as f:
         f.write('\n'.join(CLASSES))
 
+    files = sorted(f for f in os.listdir(folder_path) if f.endswith(".bpmn"))
+    bundle = load_viewer_bundle(viewer_bundle)
+    from playwright.async_api import async_playwright
+
+    manifest = {"settings": None, "files": {}} if force else load_manifest(folder_path)
+    todo, sources = plan_incremental(folder_path, files, manifest, render_settings(bundle))
+    print(f"📁 Диаграмм: {len(files)}, к рендеру: {len(todo)}, актуальны: {len(files) - len(todo)}")
+    if not todo:
+        save_manifest(folder_path, manifest)
+        return
+
+    queue = asyncio.Queue()
+    for file in todo:
+        queue.put_nowait(file)
+    progress = _Progress(len(todo))
+
     async with async_playwright() as p:
         browser = await p.chromium.launch()
-        page = await browser.new_page()
-        img_w, img_h = 1600, 1600
-        await page.set_viewport_size({"width": img_w, "height": img_h})
-        await page.set_content(html_template)
-
-        ns = {
-            'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
-            'bpmndi': 'http://www.omg.org/spec/BPMN/20100524/DI',
-            'omgdc': 'http://www.omg.org/spec/DD/20100524/DC'
-        }
-
-        for file in os.listdir(folder_path):
-            if not file.endswith(".bpmn"): continue
-
-            xml_path = os.path.join(folder_path, file)
-            base_name = os.path.splitext(file)[0]
-            png_path = os.path.join(folder_path, base_name + ".png")
-            txt_path = os.path.join(folder_path, base_name + ".txt")
-
-            try:
-                tree = ET.parse(xml_path)
-                root = tree.getroot()
-
-                with open(xml_path, 'r', encoding='utf-8') as f:
-                    xml_content = f.read()
-
-                render_meta = await page.evaluate("xml => window.getRenderData(xml)", xml_content)
-                if not render_meta['success']:
-                    print(f"⚠️ Ошибка рендеринга {file}: {render_meta.get('error')}")
-                    continue
-
-                await asyncio.sleep(0.6)
-                await page.screenshot(path=png_path)
-
-                scale, off_x, off_y = render_meta['scale'], render_meta['x_offset'], render_meta['y_offset']
-                yolo_labels = []
-
-                element_map = {}
-                for el in root.iter():
-                    tag = el.tag.split('}')[-1]
-                    el_id = el.get('id')
-                    if el_id:
-                        element_map[el_id] = tag
-
-                for shape in root.findall('.//bpmndi:BPMNShape', ns):
-                    bpmn_id = shape.get('bpmnElement')
-                    tag = element_map.get(bpmn_id, "")
-
-                    # Игнорируем контейнеры и связи, чтобы модель не путалась
-                    if tag in ['participant', 'lane', 'collaboration', 'textAnnotation', 'association']:
-                        continue
-
-                    bounds = shape.find('omgdc:Bounds', ns)
-                    if bounds is None: continue
-
-                    cls = -1
-                    tag_l = tag.lower()
-
-                    # 0: Tasks, Call Activities, Subprocesses (Прямоугольники)
-                    if 'task' in tag_l or 'callactivity' in tag_l or 'subprocess' in tag_l:
-                        cls = 0
-                    # 1: Gateways (Ромбы)
-                    elif 'gateway' in tag_l:
-                        cls = 1
-                    # 2: Start Events (Тонкий круг)
-                    elif 'startevent' in tag_l:
-                        cls = 2
-                    # 3: End Events (Жирный круг)
-                    elif 'endevent' in tag_l:
-                        cls = 3
-                    # 4: Intermediate / Boundary Events (Двойной круг)
-                    elif 'intermediate' in tag_l or 'boundaryevent' in tag_l:
-                        cls = 4
-
-                    if cls != -1:
-                        x = (float(bounds.get('x')) - off_x) * scale
-                        y = (float(bounds.get('y')) - off_y) * scale
-                        w = float(bounds.get('width')) * scale
-                        h = float(bounds.get('height')) * scale
-
-                        cx = (x + w / 2) / img_w
-                        cy = (y + h / 2) / img_h
-                        nw, nh = w / img_w, h / img_h
-
-                        if 0 <= cx <= 1 and 0 <= cy <= 1:
-                            yolo_labels.append(f"{cls} {cx:.6f} {cy:.6f} {nw:.6f} {nh:.6f}")
-
-                with open(txt_path, 'w') as f:
-                    f.write("\n".join(yolo_labels))
-                print(f"✅ {file}: записано {len(yolo_labels)} узлов")
-
-            except Exception as e:
-                print(f"❌ Ошибка {file}: {e}")
+        pages = []
+        for _ in range(contexts):
+            context = await _new_render_context(browser, bundle)
+            for _ in range(pages_per_context):
+                page = await context.new_page()
+                await page.goto(f"{RENDER_ORIGIN}/index.html")
+                pages.append(page)
 
+        # Каждая страница забирает следующий файл из общей очереди
+        try:
+            await asyncio.gather(*(_page_worker(page, folder_path, queue, progress, manifest, sources)
+                                   for page in pages))
+        finally:
+            save_manifest(folder_path, manifest)
         await browser.close()
 
 
 if __name__ == "__main__":
     # Убедись, что путь правильный
     path = r'C:\Users\VelmorSDFG\PycharmProjects\BPMN\uploads\raw\bpmn\02-Results'
-    asyncio.run(process_bpmn_dataset(path))
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Рендер BPMN и разметка для YOLO")
+    parser.add_argument('folder', nargs='?', default=path)
+    parser.add_argument('--contexts', type=int, default=RENDER_CONTEXTS, help="Число браузерных контекстов")
+    parser.add_argument('--pages', type=int, default=RENDER_PAGES_PER_CONTEXT, help="Страниц в каждом контексте")
+    parser.add_argument('--viewer-bundle', default=VIEWER_BUNDLE_PATH, help="Локальный bpmn-viewer.production.min.js")
+    parser.add_argument('--force', action='store_true', help="Игнорировать манифест и перерендерить все")
+    parser.add_argument('--geometry-only', action='store_true',
+                        help="Только .txt без браузера: вид fit-viewport вычисляется по DI")
+    parser.add_argument('--workers', type=int, default=GEOMETRY_WORKERS, help="Процессы для --geometry-only")
+    args = parser.parse_args()
+    if args.geometry_only:
+        label_dataset_geometry(args.folder, workers=args.workers)
+        raise SystemExit(0)
+    asyncio.run(process_bpmn_dataset(args.folder, contexts=args.contexts, pages_per_context=args.pages,
+                                     viewer_bundle=args.viewer_bundle, force=args.force))
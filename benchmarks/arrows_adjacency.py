@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from src import slip_arrows
+from benchmarks.reference import reference_adjacency, reference_detect_orthogonal_arrows
+from benchmarks.synthetic import random_segments, connectors_image
+
+# Регрессия: сеточный индекс в slip_arrows обязан давать тот же граф и те же стрелки (tip и порядок starts),
+# что и исходная реализация (перебор всех пар + BFS). Коннекторы без наконечников проверяют выбор tip
+# при равной плотности концов — он зависит от порядка обхода группы.
+
+
+def check_adjacency(sizes=(100, 500, 2000)):
+    ok = True
+    for n in sizes:
+        segments = random_segments(n, seed=n)
+        t0 = time.perf_counter()
+        expected = reference_adjacency(segments)
+        t_ref = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        actual = slip_arrows._segment_pairs(segments)
+        t_new = time.perf_counter() - t0
+
+        same = {(i, j) for i in expected for j in expected[i] if i < j} == actual
+        ok &= same
+        print(f"{n:>6} сегментов: перебор {t_ref * 1000:9.1f} мс, сетка {t_new * 1000:8.1f} мс "
+              f"{'✅' if same else '❌ граф отличается'}")
+    return ok
+
+
+def check_arrows(connector_counts=(10, 40, 120, 400), arrowheads=True):
+    ok = True
+    for n in connector_counts:
+        img = connectors_image(width=3000, height=2000, n=n, seed=n, arrowheads=arrowheads)
+        t0 = time.perf_counter()
+        expected = reference_detect_orthogonal_arrows(img)
+        t_ref = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        actual = slip_arrows.detect_orthogonal_arrows(img)
+        t_new = time.perf_counter() - t0
+
+        same = expected == actual
+        ok &= same
+        print(f"{n:>6} коннекторов{'' if arrowheads else ' (без наконечников)'}: {len(actual)} стрелок, было {t_ref * 1000:9.1f} мс, стало {t_new * 1000:8.1f} мс "
+              f"{'✅' if same else '❌ стрелки отличаются'}")
+    return ok
+
+
+if __name__ == "__main__":
+    passed = check_adjacency() & check_arrows() & check_arrows(arrowheads=False)
+    sys.exit(0 if passed else 1)
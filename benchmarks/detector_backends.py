@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from ParserBPMN import CLASSES
+from src.models import DETECTOR_BACKENDS, MODEL_WEIGHTS_PATH, EXPORT_IMGSZ, export_detector, get_yolo
+from src.test_model import _detect_full
+
+# Сравнение бэкендов детектора узлов на CPU: задержка на изображение и дрейф mAP относительно PyTorch.
+# Данные — val-сплит, который строит splitter.py (папки dataset/val/images или список dataset/val.txt).
+
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+
+
+def _val_images(dataset_dir):
+    list_path = os.path.join(dataset_dir, 'val.txt')
+    if os.path.exists(list_path):
+        with open(list_path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    images_dir = os.path.join(dataset_dir, 'val', 'images')
+    return [os.path.join(images_dir, f) for f in sorted(os.listdir(images_dir)) if f.endswith('.png')]
+
+
+def _data_yaml(dataset_dir):
+    # YAML для model.val: сплит в режиме list задается файлом, иначе — папкой изображений
+    list_mode = os.path.exists(os.path.join(dataset_dir, 'val.txt'))
+    lines = [f"path: {os.path.abspath(dataset_dir)}",
+             f"train: {'train.txt' if list_mode else 'train/images'}",
+             f"val: {'val.txt' if list_mode else 'val/images'}",
+             "names:"] + [f"  {i}: {name}" for i, name in enumerate(CLASSES)]
+    fd, path = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def _latency(model, images):
+    _detect_full(model, images[0])  # прогрев
+    times = []
+    for img in images:
+        t0 = time.perf_counter()
+        _detect_full(model, img)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def run(dataset_dir, backends, weights_path, imgsz, limit):
+    paths = _val_images(dataset_dir)[:limit]
+    if not paths:
+        raise SystemExit(f"❌ Пустой val-сплит: {dataset_dir}")
+    images = [cv2.imread(p) for p in paths]
+    data_yaml = _data_yaml(dataset_dir)
+
+    results = {}
+    try:
+        for backend in backends:
+            path = export_detector(backend, weights_path, imgsz=imgsz, data=data_yaml)
+            model = get_yolo(path)
+            metrics = model.val(data=data_yaml, split='val', imgsz=imgsz, batch=1, device='cpu',
+                                plots=False, verbose=False)
+            results[backend] = {
+                "weights": path,
+                "latency_ms": _latency(model, images) * 1000,
+                "map50": float(metrics.box.map50),
+                "map50_95": float(metrics.box.map),
+            }
+    finally:
+        os.remove(data_yaml)
+
+    base = results.get('torch')
+    print(f"{'backend':<16}{'мс/изобр':>10}{'mAP50':>9}{'mAP50-95':>10}{'Δ mAP50-95':>12}{'ускорение':>11}")
+    for backend, r in results.items():
+        drift = f"{r['map50_95'] - base['map50_95']:+.4f}" if base else "-"
+        speedup = f"x{base['latency_ms'] / r['latency_ms']:.2f}" if base else "-"
+        print(f"{backend:<16}{r['latency_ms']:10.1f}{r['map50']:9.4f}{r['map50_95']:10.4f}{drift:>12}{speedup:>11}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка и дрейф mAP экспортированных бэкендов детектора")
+    parser.add_argument('dataset', help="Папка датасета, созданная splitter.py")
+    parser.add_argument('--backends', nargs='+', default=list(DETECTOR_BACKENDS), choices=DETECTOR_BACKENDS)
+    parser.add_argument('--weights', default=MODEL_WEIGHTS_PATH)
+    parser.add_argument('--imgsz', type=int, default=EXPORT_IMGSZ)
+    parser.add_argument('--limit', type=int, default=100, help="Изображений для замера задержки")
+    args = parser.parse_args()
+
+    results = run(args.dataset, args.backends, args.weights, args.imgsz, args.limit)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = os.path.join(RESULTS_DIR, time.strftime("detectors_%Y%m%d_%H%M%S.json"))
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"📄 {out}")
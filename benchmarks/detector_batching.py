@@ -0,0 +1,95 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import cv2
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from src.models import DETECTOR_BACKENDS, DETECTOR_BACKEND, set_detector_backend, get_detector
+from src.test_model import detect_nodes, detect_nodes_batch, _batch_bucket
+from benchmarks.synthetic import synthetic_diagram
+
+# Пакетная детекция сервиса против поштучной: пропускная способность и расхождение боксов.
+# Окно сервиса — несколько изображений разных размеров; detect_nodes_batch сводит их в корзины letterbox,
+# detect_nodes вызывает predict на каждое изображение с imgsz по его размеру.
+
+
+def _iou(a, b):
+    iw = min(a[2], b[2]) - max(a[0], b[0])
+    ih = min(a[3], b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def _drift(single, batched):
+    """(сопоставлено, только поштучно, только в пакете, средний IoU сопоставленных) по классу и IoU >= 0.5."""
+    matched, ious, pool = 0, [], list(batched)
+    for label, box in single:
+        best = max(((k, _iou(box, b)) for k, (l, b) in enumerate(pool) if l == label), key=lambda t: t[1],
+                   default=(None, 0.0))
+        if best[1] >= 0.5:
+            pool.pop(best[0])
+            matched += 1
+            ious.append(best[1])
+    return matched, len(single) - matched, len(pool), statistics.mean(ious) if ious else 1.0
+
+
+def _timed(fn, repeats):
+    fn()  # прогрев
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def run(imgs, repeats):
+    print(f"Изображений в окне: {len(imgs)}, корзин letterbox: {len({_batch_bucket(i.shape) for i in imgs})}")
+    single = [detect_nodes(img, tile_size=None)[0] for img in imgs]
+    batched = [d for d, _ in detect_nodes_batch(imgs)]
+    t_single = _timed(lambda: [detect_nodes(img, tile_size=None) for img in imgs], repeats)
+    t_batch = _timed(lambda: detect_nodes_batch(imgs), repeats)
+
+    totals = [0, 0, 0]
+    ious = []
+    for s, b in zip(single, batched):
+        matched, only_single, only_batch, iou = _drift(s, b)
+        totals[0] += matched
+        totals[1] += only_single
+        totals[2] += only_batch
+        ious.append(iou)
+    print(f"поштучно: {t_single / len(imgs) * 1000:8.1f} мс/изобр  ({len(imgs) / t_single:.2f} изобр/с)")
+    print(f"пакетом:  {t_batch / len(imgs) * 1000:8.1f} мс/изобр  ({len(imgs) / t_batch:.2f} изобр/с, "
+          f"x{t_single / t_batch:.2f})")
+    print(f"боксы: совпало {totals[0]}, только поштучно {totals[1]}, только в пакете {totals[2]}, "
+          f"средний IoU {statistics.mean(ious):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пакетная детекция с letterbox-корзинами против поштучной")
+    parser.add_argument('--images', nargs='*', help="Свои изображения (по умолчанию — синтетические разных размеров)")
+    parser.add_argument('--count', type=int, default=8, help="Синтетических изображений в окне")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--detector', choices=DETECTOR_BACKENDS, default=DETECTOR_BACKEND)
+    args = parser.parse_args()
+
+    set_detector_backend(args.detector)
+    if args.images:
+        imgs = [cv2.imread(p) for p in args.images]
+    else:
+        rng = random.Random(0)
+        imgs = [synthetic_diagram(12, 3, 2, rng.randint(800, 1900), rng.randint(600, 1200), seed=k)[0]
+                for k in range(args.count)]
+    try:
+        get_detector()
+    except (ImportError, RuntimeError) as e:
+        raise SystemExit(f"⏭  Детектор недоступен: {e}")
+    run(imgs, args.repeats)
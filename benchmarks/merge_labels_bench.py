@@ -0,0 +1,47 @@
+import argparse
+import copy
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from src.cutter import merge_labels
+from benchmarks.reference import reference_merge_labels
+from benchmarks.synthetic import random_text_fragments
+
+# Сравнение merge_labels с исходной реализацией (pop(0) + полный перескан после каждой склейки)
+# по скорости и по результату на синтетических наборах фрагментов.
+
+
+def _timed(fn, fragments):
+    data = copy.deepcopy(fragments)  # исходная версия портит входной список
+    t0 = time.perf_counter()
+    out = fn(data)
+    return out, time.perf_counter() - t0
+
+
+def run(sizes, max_reference):
+    ok = True
+    for n in sizes:
+        fragments = random_text_fragments(n, seed=n)
+        actual, t_new = _timed(merge_labels, fragments)
+        if n <= max_reference:
+            expected, t_ref = _timed(reference_merge_labels, fragments)
+            same = expected == actual
+            ok &= same
+            ref_info = f"было {t_ref * 1000:10.1f} мс {'✅' if same else '❌ результат отличается'}"
+        else:
+            ref_info = "исходная версия пропущена"
+        print(f"{n:>6} фрагментов -> {len(actual):>5} подписей: стало {t_new * 1000:8.1f} мс, {ref_info}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк merge_labels")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 1000, 3000, 10000])
+    parser.add_argument('--max-reference', type=int, default=10000,
+                        help="Не запускать исходную (медленную) версию на наборах больше этого")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.sizes, args.max_reference) else 1)
@@ -0,0 +1,83 @@
+import argparse
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import cv2
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from src import ocr_pass
+from src.cutter import clean_diagram_v3
+from benchmarks.synthetic import synthetic_diagram
+
+# Адаптивный масштаб перед OCR против исторического x2: время clean_diagram_v3 и полнота подписей.
+# Синтетическая диаграмма рендерится в нескольких «DPI»; полнота — доля нарисованных слов, найденных OCR,
+# считается для обоих режимов. Код выхода 1, если 'auto' хоть где-то теряет слова относительно x2 —
+# до этого OCR_SCALE_FACTOR по умолчанию остается 2.
+# Со своими изображениями (--images) эталона нет: полнота 'auto' считается относительно вывода x2.
+
+
+def _words(labels):
+    # merge_labels склеивает строки в блоки — сравниваем по словам, а не по блокам
+    return [w for l in labels for w in re.findall(r"\w+", l["txt"].lower())]
+
+
+def _recall(reference, actual):
+    if not reference:
+        return 1.0
+    found = Counter(reference) & Counter(actual)
+    return sum(found.values()) / len(reference)
+
+
+def _run(img, scale_factor):
+    ocr_pass.OCR_SCALE_FACTOR = scale_factor
+    t0 = time.perf_counter()
+    labels, _ = clean_diagram_v3(img)
+    return _words(labels), time.perf_counter() - t0
+
+
+def compare(cases):
+    """cases — (имя, изображение, эталонные слова или None). True, если 'auto' не теряет полноту."""
+    default = ocr_pass.OCR_SCALE_FACTOR
+    total_fixed = total_auto = 0.0
+    no_loss = True
+    try:
+        for name, img, truth in cases:
+            fixed, t_fixed = _run(img, 2)
+            auto, t_auto = _run(img, 'auto')
+            reference = truth if truth is not None else fixed
+            r_fixed, r_auto = _recall(reference, fixed), _recall(reference, auto)
+            total_fixed += t_fixed
+            total_auto += t_auto
+            no_loss &= r_auto >= r_fixed
+            print(f"{name:<24} x{ocr_pass.upscale_factor(img):<5} x2: {t_fixed * 1000:8.0f} мс  "
+                  f"auto: {t_auto * 1000:8.0f} мс  полнота x2 {r_fixed:.3f} / auto {r_auto:.3f} "
+                  f"({len(reference)} слов)")
+    finally:
+        ocr_pass.OCR_SCALE_FACTOR = default
+    print(f"\nИтого: x2 {total_fixed:.2f} с, auto {total_auto:.2f} с (x{total_fixed / max(total_auto, 1e-9):.2f})")
+    print("✅ 'auto' не теряет слова" if no_loss else "❌ 'auto' теряет слова относительно x2")
+    return no_loss
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Адаптивный масштаб OCR против фиксированного x2")
+    parser.add_argument('--images', nargs='*', help="Свои изображения вместо синтетических")
+    parser.add_argument('--dpi', nargs='+', type=float, default=[1.0, 1.5, 2.0, 3.0],
+                        help="Коэффициенты рендера синтетической диаграммы")
+    args = parser.parse_args()
+
+    if args.images:
+        cases = [(os.path.basename(p), cv2.imread(p), None) for p in args.images]
+    else:
+        base, _, words = synthetic_diagram(40, 8, 6, 2000, 1400, seed=7, with_words=True)
+        cases = [(f"synthetic dpi x{k}", cv2.resize(base, None, fx=k, fy=k, interpolation=cv2.INTER_CUBIC), words)
+                 for k in args.dpi]
+    try:
+        sys.exit(0 if compare(cases) else 1)
+    except (ImportError, RuntimeError) as e:
+        print(f"⏭  OCR недоступен: {e}")
@@ -0,0 +1,202 @@
+import math
+import cv2
+import numpy as np
+from src.cutter import fix_leaked_letters
+
+# Исходные (до оптимизации) реализации — эталон для регрессионных проверок и сравнения скорости.
+
+
+def reference_adjacency(raw_segments, sphere_radius=15):
+    num_segments = len(raw_segments)
+    adj = {i: set() for i in range(num_segments)}
+
+    for i in range(num_segments):
+        seg_a = raw_segments[i]
+        for j in range(i + 1, num_segments):
+            seg_b = raw_segments[j]
+            is_connected = False
+
+            for p_a in seg_a['ends']:
+                for p_b in seg_b['ends']:
+                    if math.sqrt((p_a[0] - p_b[0]) ** 2 + (p_a[1] - p_b[1]) ** 2) <= sphere_radius:
+                        is_connected = True; break
+                if is_connected: break
+
+            if not is_connected:
+                for p_a in seg_a['ends']:
+                    bx, by, bw, bh = seg_b['rect']
+                    if (bx - 5 <= p_a[0] <= bx + bw + 5 and by - 5 <= p_a[1] <= by + bh + 5):
+                        is_connected = True; break
+                if not is_connected:
+                    for p_b in seg_b['ends']:
+                        ax, ay, aw, ah = seg_a['rect']
+                        if (ax - 5 <= p_b[0] <= ax + aw + 5 and ay - 5 <= p_b[1] <= ay + ah + 5):
+                            is_connected = True; break
+            if is_connected:
+                adj[i].add(j); adj[j].add(i)
+    return adj
+
+
+def reference_detect_orthogonal_arrows(img_input):
+    if isinstance(img_input, str):
+        img = cv2.imread(img_input)
+    else:
+        img = img_input.copy()
+
+    if img is None: return []
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+
+    # --- 1. Поиск базовых линий ---
+    def find_lines_by_direction(mask, direction='h'):
+        size = 15
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, 1) if direction == 'h' else (1, size))
+        line_mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        line_mask = cv2.dilate(line_mask, np.ones((3, 3), np.uint8), iterations=1)
+        cnts, _ = cv2.findContours(line_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        results = []
+        for cnt in cnts:
+            x, y, w, h = cv2.boundingRect(cnt)
+            if (w if direction == 'h' else h) < 10: continue
+            ends = [(x, y + h // 2), (x + w, y + h // 2)] if direction == 'h' else [(x + w // 2, y),
+                                                                                    (x + w // 2, y + h)]
+            results.append({'rect': [int(x), int(y), int(w), int(h)], 'ends': ends, 'dir': direction.upper()})
+        return results
+
+    raw_segments = find_lines_by_direction(binary, 'h') + find_lines_by_direction(binary, 'v')
+    num_segments = len(raw_segments)
+    if num_segments == 0: return []
+
+    # --- 2. Построение графа связей ---
+    adj = {i: set() for i in range(num_segments)}
+    sphere_radius = 15
+
+    for i in range(num_segments):
+        seg_a = raw_segments[i]
+        for j in range(i + 1, num_segments):
+            seg_b = raw_segments[j]
+            is_connected = False
+
+            for p_a in seg_a['ends']:
+                for p_b in seg_b['ends']:
+                    if math.sqrt((p_a[0] - p_b[0]) ** 2 + (p_a[1] - p_b[1]) ** 2) <= sphere_radius:
+                        is_connected = True; break
+                if is_connected: break
+
+            if not is_connected:
+                for p_a in seg_a['ends']:
+                    bx, by, bw, bh = seg_b['rect']
+                    if (bx - 5 <= p_a[0] <= bx + bw + 5 and by - 5 <= p_a[1] <= by + bh + 5):
+                        is_connected = True; break
+                if not is_connected:
+                    for p_b in seg_b['ends']:
+                        ax, ay, aw, ah = seg_a['rect']
+                        if (ax - 5 <= p_b[0] <= ax + aw + 5 and ay - 5 <= p_b[1] <= ay + ah + 5):
+                            is_connected = True; break
+            if is_connected:
+                adj[i].add(j); adj[j].add(i)
+
+    # --- 3. Группировка (BFS) ---
+    groups = []
+    visited = set()
+    for i in range(num_segments):
+        if i not in visited:
+            group = []; queue = [i]; visited.add(i)
+            while queue:
+                curr = queue.pop(0)
+                group.append(raw_segments[curr])
+                for n in adj[curr]:
+                    if n not in visited: visited.add(n); queue.append(n)
+            groups.append(group)
+
+    # --- 4. Анализ и Фильтрация пустых стрелок ---
+    arrows_final_data = []
+
+    for g_idx, group in enumerate(groups):
+        external_ends = []
+        for seg in group:
+            for ex, ey in seg['ends']:
+                is_internal = False
+                neighbor_count = 0
+                for other_seg in group:
+                    if other_seg is seg: continue
+                    ox, oy, ow, oh = other_seg['rect']
+                    if (ox - 8 <= ex <= ox + ow + 8 and oy - 8 <= ey <= oy + oh + 8):
+                        neighbor_count += 1
+                    for p_o in other_seg['ends']:
+                        if math.sqrt((ex - p_o[0]) ** 2 + (ey - p_o[1]) ** 2) < 12:
+                            is_internal = True; break
+                    if is_internal: break
+
+                if neighbor_count > 0: is_internal = True
+                if not is_internal: external_ends.append((int(ex), int(ey)))
+
+        # Определение TIP
+        best_tip = None
+        max_density = -1
+        for ex, ey in external_ends:
+            r = 15
+            roi = binary[max(0, ey - r):ey + r, max(0, ex - r):ex + r]
+            density = cv2.countNonZero(roi)
+            if density > max_density:
+                max_density = density
+                best_tip = [ex, ey]
+
+        # STARTS — внешние концы без учета tip
+        start_points = [p for p in external_ends if p != best_tip]
+
+        # Записываем только если стрелка не пустая
+        if best_tip is not None or len(start_points) > 0:
+            arrows_final_data.append({
+                "id": f"arrow_{len(arrows_final_data)}", # Пересчитываем ID, чтобы не было дырок
+                "tip": best_tip,
+                "starts": start_points
+            })
+
+    return arrows_final_data
+
+
+def reference_merge_labels(labels, x_threshold=50, y_threshold=35):
+    """Объединяет блоки текста и возвращает их в формате cnt/wh."""
+    if not labels: return []
+    # Сначала фильтруем вложенные (логика остается той же, работаем с временным bbox)
+    labels.sort(key=lambda b: (b['bbox'][1], b['bbox'][0]))
+
+    merged_raw = []
+    while labels:
+        curr = labels.pop(0)
+        i = 0
+        while i < len(labels):
+            other = labels[i]
+            c_x1, c_y1, c_x2, c_y2 = curr['bbox']
+            o_x1, o_y1, o_x2, o_y2 = other['bbox']
+
+            is_same_line = abs(c_y1 - o_y1) < 12
+            horizontal_join = is_same_line and -10 < (o_x1 - c_x2) < x_threshold
+
+            y_dist = o_y1 - c_y2
+            overlap_width = min(c_x2, o_x2) - max(c_x1, o_x1)
+            vertical_join = (overlap_width > min(c_x2 - c_x1, o_x2 - o_x1) * 0.5) and 0 <= y_dist < y_threshold
+
+            if horizontal_join or vertical_join:
+                curr['text'] = fix_leaked_letters(f"{curr['text']} {other['text']}")
+                curr['bbox'] = [min(c_x1, o_x1), min(c_y1, o_y1), max(c_x2, o_x2), max(c_y2, o_y2)]
+                labels.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged_raw.append(curr)
+
+    # ПРЕОБРАЗОВАНИЕ В НОВЫЙ ФОРМАТ
+    final_compact = []
+    for item in merged_raw:
+        x1, y1, x2, y2 = item['bbox']
+        final_compact.append({
+            "txt": item['text'].strip(),
+            "cnt": [int((x1 + x2) / 2), int((y1 + y2) / 2)],
+            "wh": [int(x2 - x1), int(y2 - y1)]
+        })
+    return final_compact
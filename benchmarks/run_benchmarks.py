@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.synthetic import synthetic_diagram, random_text_fragments
+from src.cutter import merge_labels, clean_diagram_v3
+from src.slip_arrows import detect_orthogonal_arrows
+from src.test_model import predict_and_show, erase_nodes
+from src.profiling import _rss_mb, rss_peak
+
+# Воспроизводимый бенчмарк этапов пайплайна на синтетических диаграммах разного размера.
+# Каждый этап меряется отдельно: медиана времени по повторам и пик памяти. Для чистого Python/numpy пик
+# считает tracemalloc; этапы с моделями выделяют память в нативном коде Paddle/torch, которую он не видит, —
+# для них пик — максимальный прирост RSS процесса за прогон (опрос RSS, см. src/profiling.py).
+# Результат сравнивается с сохраненным baseline (benchmarks/baseline.json, записан --update-baseline на
+# эталонной машине); при замедлении больше порога — код выхода 1. Время зависит от железа: на другой машине
+# baseline нужно перезаписать тем же флагом до сравнения.
+# Этапы с моделями (MODEL_STAGES) без записи в baseline — ошибка, а не пропуск сравнения: иначе регрессии
+# YOLO/OCR не ловятся никогда. Записать их на машине с best.pt и PaddleOCR:
+#   python benchmarks/run_benchmarks.py --stages clean_diagram_v3 predict_and_show --update-baseline
+# На машине без моделей эти этапы пропускаются с предупреждением; --require-models делает пропуск ошибкой.
+
+BASELINE_PATH = os.path.join(PROJECT_ROOT, 'benchmarks', 'baseline.json')
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+
+# (имя, задачи, шлюзы, события, ширина, высота)
+SCENARIOS = [
+    ("small", 20, 4, 4, 1600, 1200),
+    ("medium", 80, 16, 12, 3200, 2400),
+    ("large", 250, 50, 30, 6000, 4000),
+]
+STAGES = ['merge_labels', 'detect_orthogonal_arrows', 'clean_diagram_v3', 'predict_and_show']
+# Этапы с моделями YOLO/PaddleOCR: если их нельзя загрузить, этап пропускается
+MODEL_STAGES = {'clean_diagram_v3', 'predict_and_show'}
+
+
+def _tracemalloc_peak_mb(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def _rss_peak_mb(fn):
+    """Максимальный прирост RSS за время fn(): учитывает и нативные выделения Paddle/torch."""
+    before = _rss_mb()
+    with rss_peak() as peak:
+        fn()
+    return None if before is None or peak["mb"] is None else peak["mb"] - before
+
+
+def _measure(fn, repeats, native=False):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    # Память — отдельным прогоном: tracemalloc заметно замедляет код и исказил бы время
+    peak = _rss_peak_mb(fn) if native else _tracemalloc_peak_mb(fn)
+    return {"latency_s": statistics.median(times), "peak_mem_mb": peak,
+            "mem_metric": "rss" if native else "tracemalloc"}
+
+
+def _stage_fn(stage, scenario, img, nodes):
+    name, n_tasks, n_gw, n_ev, w, h = scenario
+    if stage == 'merge_labels':
+        # Фрагментов OCR примерно по 4 на узел
+        fragments = random_text_fragments(4 * (n_tasks + n_gw + n_ev), seed=n_tasks)
+        return lambda: merge_labels(fragments)
+    if stage == 'detect_orthogonal_arrows':
+        # Стрелки ищутся на изображении без узлов, как в пайплайне
+        boxes = [(c[0] - s[0] // 2 - 4, c[1] - s[1] // 2 - 4, c[0] + s[0] // 2 + 4, c[1] + s[1] // 2 + 4)
+                 for c, s in ((n["cnt"], n["wh"]) for n in nodes)]
+        cleaned = erase_nodes(img, boxes)
+        return lambda: detect_orthogonal_arrows(cleaned)
+    if stage == 'clean_diagram_v3':
+        return lambda: clean_diagram_v3(img)
+    if stage == 'predict_and_show':
+        return lambda: predict_and_show(img)
+    raise ValueError(stage)
+
+
+def run(stages, scenarios, repeats):
+    """(замеры по ключам этап/сценарий, список пропущенных ключей)."""
+    results, skipped = {}, []
+    for scenario in scenarios:
+        name, n_tasks, n_gw, n_ev, w, h = scenario
+        img, nodes = synthetic_diagram(n_tasks, n_gw, n_ev, w, h, seed=n_tasks)
+        for stage in stages:
+            key = f"{stage}/{name}"
+            try:
+                fn = _stage_fn(stage, scenario, img, nodes)
+                if stage in MODEL_STAGES:
+                    fn()  # прогрев: загрузка моделей не должна попадать в замер
+                res = _measure(fn, repeats, native=stage in MODEL_STAGES)
+            except (ImportError, RuntimeError) as e:
+                print(f"⏭  {key}: пропущен ({e})")
+                skipped.append(key)
+                continue
+            res.update({"pixels": w * h, "nodes": len(nodes)})
+            results[key] = res
+            mem = "-" if res['peak_mem_mb'] is None else f"{res['peak_mem_mb']:.1f}"
+            print(f"{key:<40} {res['latency_s'] * 1000:10.1f} мс {mem:>9} МБ ({res['mem_metric']})")
+    return results, skipped
+
+
+def compare(results, baseline, threshold):
+    """Список регрессий: этап медленнее (или тяжелее по памяти) baseline больше чем на threshold."""
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if not base: continue
+        for metric in ("latency_s", "peak_mem_mb"):
+            if metric == "peak_mem_mb" and base.get("mem_metric", "tracemalloc") != res["mem_metric"]:
+                continue  # пики разных методов несравнимы
+            if (base.get(metric) or 0) <= 0 or res[metric] is None:
+                continue
+            if res[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{key} {metric}: {base[metric]:.4f} -> {res[metric]:.4f} "
+                                   f"(+{(res[metric] / base[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов пайплайна на синтетических BPMN-диаграммах")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--scenarios', nargs='+', default=[s[0] for s in SCENARIOS],
+                        choices=[s[0] for s in SCENARIOS])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.25, help="Допустимое ухудшение относительно baseline")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="Записать текущие замеры как baseline")
+    parser.add_argument('--require-models', action='store_true',
+                        help="Ошибка, если этапы с моделями пропущены (для эталонной машины)")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if s[0] in args.scenarios]
+    results, skipped = run(args.stages, scenarios, args.repeats)
+    if skipped:
+        print(f"⚠️  Не измерены (нет моделей): {', '.join(skipped)} — регрессии этих этапов не проверены")
+        if args.require_models:
+            sys.exit(1)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    report = {"machine": platform.platform(), "python": platform.python_version(), "results": results}
+    with open(os.path.join(RESULTS_DIR, time.strftime("bench_%Y%m%d_%H%M%S.json")), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"📌 Baseline обновлен: {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️  Baseline не найден ({args.baseline}), сравнение пропущено. Запустите с --update-baseline.")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    missing = []
+    for key in sorted(set(results) - set(baseline)):
+        if key.split('/')[0] in MODEL_STAGES:
+            print(f"❌ {key}: нет в baseline — этап с моделями должен сравниваться (запишите --update-baseline)")
+            missing.append(key)
+        else:
+            print(f"ℹ️  {key}: нет в baseline, не сравнивается (добавьте --update-baseline)")
+    regressions = compare(results, baseline, args.threshold)
+    for r in regressions:
+        print(f"❌ Регрессия: {r}")
+    if not regressions and not missing:
+        print("✅ Регрессий относительно baseline нет")
+    sys.exit(1 if regressions or missing else 0)
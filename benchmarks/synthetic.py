@@ -0,0 +1,149 @@
+import random
+import cv2
+import numpy as np
+
+# Синтетические данные для бенчмарков: рисуются OpenCV, браузер не нужен.
+
+
+def random_segments(n, width=4000, height=3000, seed=0):
+    """Случайные горизонтальные/вертикальные сегменты в формате raw_segments из slip_arrows."""
+    rng = random.Random(seed)
+    segments = []
+    for _ in range(n):
+        length = rng.randint(10, 300)
+        thick = rng.randint(2, 5)
+        if rng.random() < 0.5:
+            x, y = rng.randint(0, width - length), rng.randint(0, height - thick)
+            w, h = length, thick
+            ends = [(x, y + h // 2), (x + w, y + h // 2)]
+            direction = 'H'
+        else:
+            x, y = rng.randint(0, width - thick), rng.randint(0, height - length)
+            w, h = thick, length
+            ends = [(x + w // 2, y), (x + w // 2, y + h)]
+            direction = 'V'
+        segments.append({'rect': [x, y, w, h], 'ends': ends, 'dir': direction})
+    return segments
+
+
+def random_text_fragments(n, seed=0, words_per_line=(1, 6), lines_per_block=(1, 4)):
+    """Фрагменты OCR (text/bbox/confidence), сгруппированные в строки и абзацы, как на реальных диаграммах."""
+    rng = random.Random(seed)
+    # Площадь холста растет вместе с числом фрагментов — плотность текста постоянна
+    side = int(400 * (n / 50) ** 0.5) + 400
+    fragments = []
+    while len(fragments) < n:
+        bx, by = rng.randint(0, side), rng.randint(0, side)
+        line_h = rng.randint(10, 18)
+        for line_idx in range(rng.randint(*lines_per_block)):
+            x = bx + rng.randint(-4, 4)
+            y = by + line_idx * (line_h + rng.randint(4, 10))
+            for _ in range(rng.randint(*words_per_line)):
+                w = rng.randint(15, 90)
+                fragments.append({
+                    "text": "".join(rng.choice("абвгдежзиклмнопрстуфхцчшэюя0123456789") for _ in range(max(1, w // 9))),
+                    "bbox": [x, y + rng.randint(-2, 2), x + w, y + line_h],
+                    "confidence": 0.9
+                })
+                x += w + rng.randint(5, 40)
+                if len(fragments) >= n:
+                    return fragments
+    return fragments
+
+
+def draw_connectors(img, n, seed=0, margin=40, arrowheads=True):
+    """Рисует n ортогональных коннекторов (1-2 излома); arrowheads=False — без наконечников."""
+    rng = random.Random(seed)
+    h, w = img.shape[:2]
+    for _ in range(n):
+        x0, y0 = rng.randint(margin, w - margin), rng.randint(margin, h - margin)
+        x1, y1 = rng.randint(margin, w - margin), rng.randint(margin, h - margin)
+        if rng.random() < 0.5:
+            pts = [(x0, y0), (x1, y0), (x1, y1)]
+        else:
+            xm = (x0 + x1) // 2
+            pts = [(x0, y0), (xm, y0), (xm, y1), (x1, y1)]
+        for a, b in zip(pts[:-1], pts[1:]):
+            if a != b:
+                cv2.line(img, a, b, (0, 0, 0), 2)
+        (ax, ay), (bx, by) = pts[-2], pts[-1]
+        if arrowheads and (ax, ay) != (bx, by):
+            cv2.arrowedLine(img, (ax, ay), (bx, by), (0, 0, 0), 2, tipLength=min(1.0, 12 / max(1, abs(bx - ax) + abs(by - ay))))
+    return img
+
+
+def connectors_image(width=1600, height=1200, n=40, seed=0, arrowheads=True):
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    return draw_connectors(img, n, seed=seed, arrowheads=arrowheads)
+
+
+_WORDS = ["order", "check", "invoice", "send", "approve", "client", "report", "pay", "ship", "review", "data", "store"]
+
+
+def _put_centered(img, text, cx, cy, scale=0.5):
+    (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 1)
+    cv2.putText(img, text, (int(cx - tw / 2), int(cy + th / 2)), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 1,
+                cv2.LINE_AA)
+
+
+def synthetic_diagram(n_tasks=20, n_gateways=5, n_events=4, width=1600, height=1200, seed=0, with_words=False):
+    """BPMN-подобная диаграмма: задачи с текстом, шлюзы, события и ортогональные связи со стрелками.
+
+    Узлы раскладываются по сетке, связи идут между соседями по порядку. Возвращает (изображение, узлы),
+    где узел — {"type", "cnt", "wh"}; подписи к связям рисуются рядом с изломами.
+    with_words=True — третьим элементом список всех нарисованных слов (эталон для полноты OCR).
+    """
+    rng = random.Random(seed)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    kinds = ['Task'] * n_tasks + ['Gateway'] * n_gateways + ['StartEvent', 'EndEvent'] * (n_events // 2)
+    kinds += ['IntermediateEvent'] * (n_events % 2)
+    rng.shuffle(kinds)
+
+    cols = max(1, int(np.ceil(np.sqrt(len(kinds) * width / height))))
+    rows = max(1, int(np.ceil(len(kinds) / cols)))
+    cell_w, cell_h = width / cols, height / rows
+    tw, th = int(min(120, cell_w * 0.55)), int(min(70, cell_h * 0.45))
+    r = int(min(20, cell_w * 0.15, cell_h * 0.2))
+
+    nodes, words = [], []
+    for k, kind in enumerate(kinds):
+        cx = int((k % cols + 0.5) * cell_w)
+        cy = int((k // cols + 0.5) * cell_h)
+        if kind == 'Task':
+            cv2.rectangle(img, (cx - tw // 2, cy - th // 2), (cx + tw // 2, cy + th // 2), (0, 0, 0), 2)
+            top, bottom = rng.choice(_WORDS), rng.choice(_WORDS)
+            _put_centered(img, top, cx, cy - 8, 0.4)
+            _put_centered(img, bottom, cx, cy + 10, 0.4)
+            words += [top, bottom]
+            wh = [tw, th]
+        elif kind == 'Gateway':
+            pts = np.array([[cx, cy - r - 5], [cx + r + 5, cy], [cx, cy + r + 5], [cx - r - 5, cy]], np.int32)
+            cv2.polylines(img, [pts], True, (0, 0, 0), 2)
+            wh = [2 * r + 10, 2 * r + 10]
+        else:
+            thickness = 4 if kind == 'EndEvent' else 2
+            cv2.circle(img, (cx, cy), r, (0, 0, 0), thickness)
+            if kind == 'IntermediateEvent':
+                cv2.circle(img, (cx, cy), r - 4, (0, 0, 0), 1)
+            wh = [2 * r, 2 * r]
+        nodes.append({"type": kind, "cnt": [cx, cy], "wh": wh})
+
+    # Связи: в строке — слева направо, при переходе на следующую строку — вниз через промежуток между строками
+    for a, b in zip(nodes[:-1], nodes[1:]):
+        (ax, ay), (aw, ah) = a["cnt"], a["wh"]
+        (bx, by), (bw, bh) = b["cnt"], b["wh"]
+        if by == ay:
+            pts = [(ax + aw // 2 + 2, ay), (bx - bw // 2 - 3, by)]
+        else:
+            gap_y = int(ay + cell_h / 2)
+            pts = [(ax, ay + ah // 2 + 2), (ax, gap_y), (bx, gap_y), (bx, by - bh // 2 - 3)]
+        for p, q in zip(pts[:-2], pts[1:-1]):
+            cv2.line(img, p, q, (0, 0, 0), 2)
+        cv2.arrowedLine(img, pts[-2], pts[-1], (0, 0, 0), 2,
+                        tipLength=min(1.0, 10 / max(1, abs(pts[-1][0] - pts[-2][0]) + abs(pts[-1][1] - pts[-2][1]))))
+        if len(pts) == 4 and rng.random() < 0.5:
+            label = rng.choice(["yes", "no"])
+            cv2.putText(img, label, (pts[1][0] + 6, pts[1][1] - 6), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.4, (0, 0, 0), 1, cv2.LINE_AA)
+            words.append(label)
+    return (img, nodes, words) if with_words else (img, nodes)
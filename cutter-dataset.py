@@ -4,6 +4,7 @@ from paddleocr import PaddleOCR
 import os
 import glob
 import random
+from src.ocr_pass import crop_scale_factor
 
 # Инициализация PaddleOCR (lang='cyrillic' для твоей версии)
 ocr = PaddleOCR(use_angle_cls=True, lang='cyrillic', show_log=False)
@@ -27,9 +28,12 @@ def test_clean_single_dataset_item(target_folder):
     img = cv2.imread(image_path)
     if img is None: return
 
-    # 3. Увеличение x2 для точности детекции
+    # 3. Масштаб по OCR_SCALE_FACTOR: x2 или, в режиме 'auto', под высоту текста (x1 и меньше для high-DPI)
     h, w = img.shape[:2]
-    upscaled = cv2.resize(img, (w * 2, h * 2), interpolation=cv2.INTER_LANCZOS4)
+    k = crop_scale_factor(img)
+    upscaled = img if k == 1 else cv2.resize(img, (int(w * k), int(h * k)),
+                                             interpolation=cv2.INTER_LANCZOS4 if k > 1 else cv2.INTER_AREA)
+    print(f"🔍 Масштаб перед OCR: x{k}")
 
     # 4. OCR детекция
     result = ocr.ocr(upscaled, cls=True)
@@ -38,9 +42,9 @@ def test_clean_single_dataset_item(target_folder):
 
     if result and result[0]:
         for line in result[0]:
-            # Возвращаем координаты к оригиналу (деление на 2)
+            # Возвращаем координаты к оригиналу (деление на масштаб)
             box = np.array(line[0], dtype=np.float32)
-            box_orig = (box / 2).astype(np.int32)
+            box_orig = (box / k).astype(np.int32)
 
             # Определяем границы рамки
             x_min, y_min = np.min(box_orig, axis=0)
@@ -1,53 +1,450 @@
 import os
 import json
+import time
+import argparse
 import cv2
 import numpy as np
 import sys
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 RESULT_DIR = os.path.join(PROJECT_ROOT, 'src', 'result')
+BATCH_RESULT_DIR = os.path.join(PROJECT_ROOT, 'src', 'result_batch')
 sys.path.append(os.path.join(PROJECT_ROOT, 'src'))
 
 SOURCE_IMAGE_DEFAULT = r'C:\Users\VelmorSDFG\PycharmProjects\BPMN\uploads\34.png'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+BATCH_WORKERS_DEFAULT = 2
+# Один OCR-проход на узлы и внешний текст вместо двух
+SHARED_OCR_DEFAULT = False
+# Промежуточные картинки этапов (0_debug.png, 1_nodes_removed.png, ...) — только для отладки
+DEBUG_DEFAULT = False
+# Потоковый режим: глубина очередей между этапами; в памяти не больше 4 + 3 * глубина изображений
+STREAM_QUEUE_DEPTH = 2
 
-from src.test_model import predict_and_show
-from src.cutter import clean_diagram_v3
+from src.models import preload, export_detector, set_detector_backend, DETECTOR_BACKENDS, DETECTOR_BACKEND
+from src.test_model import predict_and_show, detect_nodes, build_nodes_data, erase_nodes
+from src.cutter import clean_diagram_v3, shared_ocr_pass, erase_text
+from src import ocr_pass
 from src.slip_arrows import detect_orthogonal_arrows
+from src.profiling import StageProfiler, stage, aggregate_profiles
+from src.result_cache import ResultCache, pipeline_keys, CACHE_DIR, CACHE_MAX_MB
 
 
-def run_smart_pipeline(source_image_path):
-    os.makedirs(RESULT_DIR, exist_ok=True)
-    final_data = {"source_file": os.path.basename(source_image_path), "nodes": [], "labels": [], "arrows": []}
+def _json_default(obj):
+    return int(obj) if isinstance(obj, np.integer) else (obj.tolist() if isinstance(obj, np.ndarray) else str(obj))
 
+
+def result_to_json(data):
+    """Тот же текст, что пишется в analysis_result.json."""
+    return json.dumps(data, ensure_ascii=False, indent=4, default=_json_default)
+
+
+def save_result_json(data, json_path):
+    with open(json_path, 'w', encoding='utf-8') as f:
+        f.write(result_to_json(data))
+
+
+def _text_stages_shared(img, profiler=None, detection=None):
+    # Один OCR-проход по исходнику: текст узлов и внешние подписи разводятся по геометрии
+    print("1. YOLO")
+    with stage(profiler, "nodes"):
+        detections, padded_boxes = detection if detection is not None else detect_nodes(img, profiler=profiler)
+
+    print("2. Общий OCR (узлы + внешний текст)")
+    with stage(profiler, "text"):
+        node_texts, external_labels, text_mask = shared_ocr_pass(img, padded_boxes, profiler=profiler)
+        nodes = build_nodes_data(detections, node_texts)
+        img_fully_cleaned = erase_text(erase_nodes(img, padded_boxes), text_mask, profiler=profiler)
+    return nodes, external_labels, img_fully_cleaned
+
+
+def _text_stages(img, debug_dir, profiler=None, cache=None, keys=None, detection=None):
     # ЭТАП 1: детекция узлов
     print("1. YOLO + Внутренний OCR")
-    nodes, img_nodes_removed = predict_and_show(source_image_path)
+    cached = cache.get(keys["nodes"]) if cache is not None else None
+    if cached is not None:
+        print("   (из кеша)")
+        nodes, img_nodes_removed = cached
+    else:
+        with stage(profiler, "nodes"):
+            nodes, img_nodes_removed = predict_and_show(img, debug_dir=debug_dir, profiler=profiler,
+                                                        detection=detection)
+        if cache is not None:
+            cache.put(keys["nodes"], (nodes, img_nodes_removed))
 
     # ЭТАП 2: внешний текст
     print("2. OCR Внешнего текста")
-    external_labels, img_fully_cleaned = clean_diagram_v3(img_nodes_removed, output_dir=RESULT_DIR)
+    with stage(profiler, "text"):
+        external_labels, img_fully_cleaned = clean_diagram_v3(img_nodes_removed, output_dir=debug_dir,
+                                                              profiler=profiler)
+    return nodes, external_labels, img_fully_cleaned
+
+
+def run_smart_pipeline(source_image, output_dir=RESULT_DIR, shared_ocr=SHARED_OCR_DEFAULT, debug=DEBUG_DEFAULT,
+                       source_name=None, profiler=None, cache=None, detection=None, keys=None):
+    """source_image — путь или уже декодированное BGR-изображение.
+
+    Изображение декодируется один раз и передается между этапами в памяти;
+    промежуточные PNG пишутся только при debug. С profiler замеры этапов сохраняются в profile.json.
+    cache — ResultCache: этапы с уже посчитанным результатом для той же картинки и тех же параметров
+    пропускаются. В режиме debug кеш не используется, чтобы этапы записали свои картинки.
+    detection — готовый результат detect_nodes для этого изображения (пакетная детекция).
+    keys — уже посчитанные pipeline_keys (сервис считает их до детекции, чтобы проверить кеш).
+    output_dir=None — ничего не писать на диск, только вернуть результат.
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    if isinstance(source_image, str):
+        with stage(profiler, "decode"):
+            img = cv2.imread(source_image)
+        if img is None:
+            raise ValueError(f"Не удалось прочитать изображение: {source_image}")
+        source_name = source_name or os.path.basename(source_image)
+    else:
+        img = source_image
+    debug = debug and output_dir is not None
+    debug_dir = output_dir if debug else None
+    final_data = {"source_file": source_name, "nodes": [], "labels": [], "arrows": []}
+
+    cache = None if debug else cache
+    if cache is not None and keys is None:
+        with stage(profiler, "cache_lookup"):
+            keys = pipeline_keys(img, shared_ocr)
+    text = cache.get(keys["text"]) if cache is not None else None
+    arrows = cache.get(keys["arrows"]) if text is not None else None
+    img_fully_cleaned = None
+    if text is not None and arrows is None:
+        # Узлы и подписи уже есть — для стрелок нужна только очищенная картинка
+        img_fully_cleaned = cache.get(keys["text_image"])
+
+    if text is not None and (arrows is not None or img_fully_cleaned is not None):
+        print("1-2. Узлы и текст (из кеша)")
+        nodes, external_labels = text
+    else:
+        if shared_ocr:
+            nodes, external_labels, img_fully_cleaned = _text_stages_shared(img, profiler=profiler,
+                                                                            detection=detection)
+        else:
+            nodes, external_labels, img_fully_cleaned = _text_stages(img, debug_dir, profiler=profiler,
+                                                                     cache=cache, keys=keys, detection=detection)
+        if cache is not None:
+            cache.put(keys["text"], (nodes, external_labels))
+            cache.put(keys["text_image"], img_fully_cleaned)
 
     final_data["nodes"] = nodes
     final_data["labels"] = external_labels
 
     # ЭТАП 3: поиск стрелок
     print("3. Поиск стрелок")
-    cv2.imwrite(os.path.join(RESULT_DIR, "final_cleaned_for_arrows.png"), img_fully_cleaned)
+    if debug:
+        cv2.imwrite(os.path.join(output_dir, "final_cleaned_for_arrows.png"), img_fully_cleaned)
 
-    arrows = detect_orthogonal_arrows(img_fully_cleaned, output_dir=RESULT_DIR)
+    if arrows is not None:
+        print("   (из кеша)")
+    else:
+        with stage(profiler, "arrows"):
+            arrows = detect_orthogonal_arrows(img_fully_cleaned, output_dir=debug_dir, profiler=profiler)
+        if cache is not None:
+            cache.put(keys["arrows"], arrows)
     final_data["arrows"] = arrows
 
+    if output_dir is None:
+        return final_data
+
     # Итоговый Json
-    json_path = os.path.join(RESULT_DIR, "analysis_result.json")
+    save_result_json(final_data, os.path.join(output_dir, "analysis_result.json"))
+    if profiler is not None:
+        save_result_json({"source_file": source_name, "stages": profiler.summary(), "records": profiler.records},
+                         os.path.join(output_dir, "profile.json"))
 
-    def conv(obj):
-        return int(obj) if isinstance(obj, np.integer) else (obj.tolist() if isinstance(obj, np.ndarray) else str(obj))
+    print(f"\n Результаты: {output_dir}")
+    return final_data
 
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(final_data, f, ensure_ascii=False, indent=4, default=conv)
 
-    print(f"\n Результаты: {RESULT_DIR}")
+# --- ПАКЕТНЫЙ РЕЖИМ ---
+
+def collect_batch_inputs(source):
+    """Папка -> все картинки в ней; файл -> манифест (один путь на строку)."""
+    if os.path.isdir(source):
+        return [os.path.join(source, f) for f in sorted(os.listdir(source))
+                if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'): continue
+            paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return paths
+
+
+def _batch_output_dirs(paths, output_root):
+    # Одинаковые имена из разных папок манифеста не должны затирать друг друга
+    used, dirs = {}, []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        n = used.get(stem, 0)
+        used[stem] = n + 1
+        dirs.append(os.path.join(output_root, stem if n == 0 else f"{stem}_{n}"))
+    return dirs
+
+
+_worker_cache = None
+
+
+def _init_batch_worker(detector_backend=DETECTOR_BACKEND, cache_dir=None, cache_max_mb=CACHE_MAX_MB,
+                       ocr_scale=ocr_pass.OCR_SCALE_FACTOR):
+    # Модели грузятся один раз на воркер и остаются в памяти на весь пакет.
+    # Кеш тоже один на воркер: он ведет счетчик размера и не обходит каталог на каждом изображении
+    global _worker_cache
+    set_detector_backend(detector_backend)
+    ocr_pass.set_scale_factor(ocr_scale)  # при spawn воркер не видит настройку главного процесса
+    preload()
+    _worker_cache = ResultCache(cache_dir, cache_max_mb) if cache_dir else None
+
+
+def _process_batch_item(image_path, output_dir, shared_ocr, debug, profile):
+    profiler = StageProfiler() if profile else None
+    t0 = time.perf_counter()
+    try:
+        run_smart_pipeline(image_path, output_dir=output_dir, shared_ocr=shared_ocr, debug=debug, profiler=profiler,
+                           cache=_worker_cache)
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {"source": image_path, "output_dir": output_dir, "seconds": time.perf_counter() - t0, "error": error,
+            "profile": profiler.summary() if profiler is not None else None}
+
+
+def run_batch_pipeline(source, output_root=BATCH_RESULT_DIR, workers=BATCH_WORKERS_DEFAULT,
+                       shared_ocr=SHARED_OCR_DEFAULT, debug=DEBUG_DEFAULT, profile=False, cache_dir=None,
+                       cache_max_mb=CACHE_MAX_MB, detector_backend=DETECTOR_BACKEND):
+    paths = collect_batch_inputs(source)
+    if not paths:
+        print(f"❌ Нет входных изображений: {source}")
+        return []
+
+    os.makedirs(output_root, exist_ok=True)
+    out_dirs = _batch_output_dirs(paths, output_root)
+
+    # Экспорт весов — один раз до старта воркеров, иначе они начнут экспортировать одновременно
+    export_detector(detector_backend)
+
+    results = []
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(detector_backend, cache_dir, cache_max_mb, ocr_pass.OCR_SCALE_FACTOR)) as pool:
+        futures = [pool.submit(_process_batch_item, p, d, shared_ocr, debug, profile)
+                   for p, d in zip(paths, out_dirs)]
+        for fut in as_completed(futures):
+            res = fut.result()
+            results.append(res)
+            status = "✅" if res["error"] is None else f"❌ {res['error']}"
+            print(f"[{len(results)}/{len(paths)}] {os.path.basename(res['source'])}: {res['seconds']:.2f} с {status}")
+    total = time.perf_counter() - t_start
+
+    _write_batch_report(results, len(paths), workers, total, output_root, profile)
+    return results
+
+
+def _write_batch_report(results, n_images, workers, total, output_root, profile):
+    profiles = [r.pop("profile") for r in results]
+    ok = [r for r in results if r["error"] is None]
+    latencies = [r["seconds"] for r in ok]
+    report = {
+        "images": n_images,
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "workers": workers,
+        "wall_seconds": total,
+        "images_per_second": len(ok) / total if total > 0 else 0.0,
+        "mean_latency_seconds": float(np.mean(latencies)) if latencies else 0.0,
+        "items": sorted(results, key=lambda r: r["output_dir"]),
+    }
+    save_result_json(report, os.path.join(output_root, "batch_report.json"))
+    if profile:
+        # Сводка по этапам за весь пакет: видно, упирается ли обработка в OCR или в поиск стрелок
+        save_result_json(aggregate_profiles([p for p in profiles if p]), os.path.join(output_root, "batch_profile.json"))
+
+    print(f"\n📊 {report['succeeded']}/{report['images']} за {total:.1f} с "
+          f"({report['images_per_second']:.2f} изобр/с, в среднем {report['mean_latency_seconds']:.2f} с на изображение)")
+
+
+# --- ПОТОКОВЫЙ РЕЖИМ ---
+# Этапы (декодирование -> YOLO -> OCR и очистка -> стрелки) работают в отдельных потоках и связаны
+# очередями ограниченной глубины: пока для изображения k ищутся стрелки, для k+1 идет OCR, для k+2 — YOLO.
+# Каждая модель используется только своим потоком, поэтому общий движок OCR не вызывается параллельно.
+
+_STREAM_END = object()
+
+
+def _stream_stage(name, fn, q_in, q_out):
+    while True:
+        item = q_in.get()
+        if item is _STREAM_END:
+            q_out.put(_STREAM_END)
+            return
+        if item["error"] is None:
+            try:
+                with stage(item["profiler"], name):
+                    fn(item)
+            except Exception as e:
+                item["error"] = f"{name}: {e}"
+        q_out.put(item)
+
+
+def run_streaming_pipeline(source, output_root=BATCH_RESULT_DIR, queue_depth=STREAM_QUEUE_DEPTH,
+                           shared_ocr=SHARED_OCR_DEFAULT, profile=False, cache_dir=None, cache_max_mb=CACHE_MAX_MB):
+    # queue.Queue(maxsize=0) — без ограничения: память перестала бы быть ограниченной
+    if queue_depth < 1:
+        raise ValueError(f"Глубина очереди должна быть >= 1: {queue_depth}")
+    paths = collect_batch_inputs(source)
+    if not paths:
+        print(f"❌ Нет входных изображений: {source}")
+        return []
+
+    os.makedirs(output_root, exist_ok=True)
+    out_dirs = _batch_output_dirs(paths, output_root)
+    preload()
+    # Ключи те же, что у run_smart_pipeline: кеш общий с обычным и пакетным режимом
+    cache = ResultCache(cache_dir, cache_max_mb) if cache_dir else None
+
+    def decode(item):
+        item["img"] = cv2.imread(item["source"])
+        if item["img"] is None:
+            raise ValueError(f"Не удалось прочитать изображение: {item['source']}")
+        if cache is None:
+            return
+        keys = item["keys"] = pipeline_keys(item["img"], shared_ocr)
+        text = cache.get(keys["text"])
+        if text is None:
+            return
+        item["arrows"] = cache.get(keys["arrows"])
+        cleaned = cache.get(keys["text_image"]) if item["arrows"] is None else None
+        if item["arrows"] is not None or cleaned is not None:
+            # Узлы и подписи из кеша — детекция и OCR этому изображению не нужны
+            item["nodes"], item["labels"] = text
+            item["img"] = cleaned
+
+    def detect(item):
+        if "nodes" in item:
+            return
+        item["detection"] = detect_nodes(item["img"], profiler=item["profiler"])
+
+    def text(item):
+        if "nodes" in item:
+            return
+        if shared_ocr:
+            result = _text_stages_shared(item["img"], profiler=item["profiler"], detection=item["detection"])
+        else:
+            result = _text_stages(item["img"], None, profiler=item["profiler"], cache=cache, keys=item.get("keys"),
+                                  detection=item["detection"])
+        item["nodes"], item["labels"], item["img"] = result  # исходник больше не нужен — держим только очищенный
+        if cache is not None:
+            cache.put(item["keys"]["text"], (item["nodes"], item["labels"]))
+            cache.put(item["keys"]["text_image"], item["img"])
+
+    def arrows(item):
+        if item.get("arrows") is None:
+            item["arrows"] = detect_orthogonal_arrows(item["img"], profiler=item["profiler"])
+            if cache is not None:
+                cache.put(item["keys"]["arrows"], item["arrows"])
+        item["img"] = item["detection"] = None
+
+    stages = [("decode", decode), ("detect", detect), ("ocr", text), ("arrows", arrows)]
+    queues = [queue.Queue(maxsize=queue_depth) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_stream_stage, args=(name, fn, queues[k], queues[k + 1]), daemon=True)
+               for k, (name, fn) in enumerate(stages)]
+    for t in threads:
+        t.start()
+
+    def feed():
+        for path, out_dir in zip(paths, out_dirs):
+            queues[0].put({"source": path, "output_dir": out_dir, "error": None, "t0": time.perf_counter(),
+                           # Этапы разных изображений идут одновременно — CPU процесса их смешал бы
+                           "profiler": StageProfiler(cpu_scope='thread') if profile else None})
+        queues[0].put(_STREAM_END)
+
+    t_start = time.perf_counter()
+    threading.Thread(target=feed, daemon=True).start()
+
+    results = []
+    while True:
+        item = queues[-1].get()
+        if item is _STREAM_END:
+            break
+        if item["error"] is None:
+            os.makedirs(item["output_dir"], exist_ok=True)
+            save_result_json({"source_file": os.path.basename(item["source"]), "nodes": item["nodes"],
+                              "labels": item["labels"], "arrows": item["arrows"]},
+                             os.path.join(item["output_dir"], "analysis_result.json"))
+        profiler = item["profiler"]
+        res = {"source": item["source"], "output_dir": item["output_dir"], "error": item["error"],
+               "seconds": time.perf_counter() - item["t0"],
+               "profile": profiler.summary() if profiler is not None else None}
+        results.append(res)
+        status = "✅" if res["error"] is None else f"❌ {res['error']}"
+        print(f"[{len(results)}/{len(paths)}] {os.path.basename(res['source'])}: {res['seconds']:.2f} с {status}")
+    total = time.perf_counter() - t_start
+
+    _write_batch_report(results, len(paths), 1, total, output_root, profile)
+    return results
 
 
 if __name__ == "__main__":
-    run_smart_pipeline(SOURCE_IMAGE_DEFAULT)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Анализ BPMN-диаграмм")
+    parser.add_argument('image', nargs='?', default=SOURCE_IMAGE_DEFAULT, help="Путь к одному изображению")
+    parser.add_argument('--batch', help="Папка с изображениями или файл-манифест (один путь на строку)")
+    parser.add_argument('--out', default=None, help="Папка для результатов")
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f"Число процессов-воркеров (по умолчанию {BATCH_WORKERS_DEFAULT})")
+    parser.add_argument('--shared-ocr', action='store_true', default=SHARED_OCR_DEFAULT,
+                        help="Один OCR-проход для текста узлов и внешних подписей")
+    parser.add_argument('--debug', action='store_true', default=DEBUG_DEFAULT,
+                        help="Сохранять промежуточные картинки этапов")
+    parser.add_argument('--profile', action='store_true',
+                        help="Замеры времени и памяти по этапам (profile.json / batch_profile.json)")
+    parser.add_argument('--cache', action='store_true', help="Кешировать результаты этапов на диске")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Папка кеша результатов")
+    parser.add_argument('--cache-max-mb', type=float, default=CACHE_MAX_MB, help="Лимит размера кеша (LRU)")
+    parser.add_argument('--detector', choices=DETECTOR_BACKENDS, default=DETECTOR_BACKEND,
+                        help="Бэкенд детектора узлов (onnx/openvino — для CPU)")
+    parser.add_argument('--int8-data', default=None,
+                        help="Калибровочный YAML для --detector openvino-int8 (по умолчанию data.yaml)")
+    parser.add_argument('--ocr-scale', choices=ocr_pass.OCR_SCALE_CHOICES, default=str(ocr_pass.OCR_SCALE_FACTOR),
+                        help="Масштаб перед OCR: фиксированный x2 или 'auto' по высоте текста")
+    parser.add_argument('--stream', action='store_true',
+                        help="Пакет в одном процессе с этапами, работающими одновременно над разными изображениями")
+    parser.add_argument('--queue-depth', type=int, default=STREAM_QUEUE_DEPTH,
+                        help="Глубина очередей между этапами (ограничивает память в --stream)")
+    args = parser.parse_args()
+    # --stream — один процесс и по потоку на этап, промежуточные картинки этапов он не сохраняет
+    if args.stream and args.workers is not None:
+        parser.error("--workers не применим к --stream (этапы работают потоками одного процесса)")
+    if args.stream and args.debug:
+        parser.error("--debug не поддерживается в --stream; используйте --batch без --stream")
+    if args.queue_depth < 1:
+        parser.error("--queue-depth должен быть >= 1")
+    set_detector_backend(args.detector)
+    ocr_pass.set_scale_factor(args.ocr_scale)
+    # Экспорт (и калибровка INT8) — до запуска воркеров; они переиспользуют готовый
+    export_detector(args.detector, data=args.int8_data)
+    cache_dir = args.cache_dir if args.cache else None
+
+    if args.batch and args.stream:
+        run_streaming_pipeline(args.batch, output_root=args.out or BATCH_RESULT_DIR, queue_depth=args.queue_depth,
+                               shared_ocr=args.shared_ocr, profile=args.profile, cache_dir=cache_dir,
+                               cache_max_mb=args.cache_max_mb)
+    elif args.batch:
+        run_batch_pipeline(args.batch, output_root=args.out or BATCH_RESULT_DIR,
+                           workers=args.workers if args.workers is not None else BATCH_WORKERS_DEFAULT,
+                           shared_ocr=args.shared_ocr, debug=args.debug, profile=args.profile,
+                           cache_dir=cache_dir, cache_max_mb=args.cache_max_mb, detector_backend=args.detector)
+    else:
+        run_smart_pipeline(args.image, output_dir=args.out or RESULT_DIR, shared_ocr=args.shared_ocr, debug=args.debug,
+                           profiler=StageProfiler() if args.profile else None,
+                           cache=ResultCache(cache_dir, args.cache_max_mb) if cache_dir else None)
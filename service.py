@@ -0,0 +1,278 @@
+import json
+import time
+import asyncio
+import argparse
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from main import run_smart_pipeline, result_to_json, SHARED_OCR_DEFAULT
+from src.models import (get_ocr, get_detector, export_detector, set_detector_backend, NODE_OCR_CONFIG, EXT_OCR_CONFIG,
+                        DETECTOR_BACKENDS, DETECTOR_BACKEND)
+from src.test_model import detect_nodes_batch
+from src.result_cache import ResultCache, pipeline_keys, CACHE_DIR, CACHE_MAX_MB
+from src import ocr_pass
+
+# Локальный HTTP-сервис анализа диаграмм.
+#   POST /analyze  — тело запроса: байты PNG/JPG; ответ — JSON как в analysis_result.json
+#   GET  /health   — состояние очередей
+# Модели загружены один раз. YOLO работает в главном процессе: одновременные запросы собираются
+# в окне BATCH_WINDOW_MS и идут общими вызовами predict — изображения разных размеров приводятся letterbox
+# к общим корзинам (см. YOLO_BATCH_BUCKETS в src/test_model.py; боксы могут немного отличаться от CLI). OCR и поиск стрелок выполняются в пуле
+# из STAGE_WORKERS процессов. Больше MAX_PENDING запросов в работе — сразу 503 (клиент повторит позже).
+
+HOST = '127.0.0.1'
+PORT = 8765
+BATCH_WINDOW_MS = 20
+MAX_BATCH = 8
+STAGE_WORKERS = 2
+MAX_PENDING = 32
+MAX_BODY_MB = 50
+STAGE_TIMEOUT_S = 300
+
+_worker_cache = None
+
+
+def _init_stage_worker(detector_backend, cache_dir, cache_max_mb, ocr_scale):
+    # Детекция уже сделана в главном процессе — воркерам нужны только движки OCR
+    global _worker_cache
+    set_detector_backend(detector_backend)
+    ocr_pass.set_scale_factor(ocr_scale)
+    for config in (NODE_OCR_CONFIG, EXT_OCR_CONFIG):
+        get_ocr(config)
+    _worker_cache = ResultCache(cache_dir, cache_max_mb) if cache_dir else None
+
+
+def _analyze(img, detection, shared_ocr, source_name, keys):
+    return run_smart_pipeline(img, output_dir=None, shared_ocr=shared_ocr, source_name=source_name,
+                              cache=_worker_cache, detection=detection, keys=keys)
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisService:
+    def __init__(self, stage_workers=STAGE_WORKERS, max_batch=MAX_BATCH, batch_window_ms=BATCH_WINDOW_MS,
+                 max_pending=MAX_PENDING, shared_ocr=SHARED_OCR_DEFAULT, detector_backend=DETECTOR_BACKEND,
+                 cache_dir=None, cache_max_mb=CACHE_MAX_MB):
+        self.max_batch = max_batch
+        self.batch_window = batch_window_ms / 1000
+        self.max_pending = max_pending
+        self.shared_ocr = shared_ocr
+        self.pending = 0
+        self.stats = {"requests": 0, "rejected": 0, "batches": 0, "batched_images": 0, "cache_hits": 0, "timeouts": 0}
+        # Главному процессу кеш нужен только для проверки до детекции; читают и пишут его воркеры
+        self._cache = ResultCache(cache_dir, cache_max_mb) if cache_dir else None
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        # Один поток на YOLO: модель не делится между вызовами, батчи идут строго по очереди
+        self._yolo_pool = ThreadPoolExecutor(max_workers=1)
+        self._stage_pool = ProcessPoolExecutor(max_workers=stage_workers, initializer=_init_stage_worker,
+                                               initargs=(detector_backend, cache_dir, cache_max_mb,
+                                                         ocr_pass.OCR_SCALE_FACTOR))
+        self._batcher = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        # Детектор грузится до приема первого запроса
+        await loop.run_in_executor(self._yolo_pool, get_detector)
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def close(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+        self._yolo_pool.shutdown(wait=False)
+        self._stage_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            imgs = [img for img, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._yolo_pool, detect_nodes_batch, imgs)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["batched_images"] += len(batch)
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+    def _cached(self, img):
+        # Узлы, подписи и стрелки уже в кеше — воркер соберет ответ без детекции
+        keys = pipeline_keys(img, self.shared_ocr, batched_detection=True)
+        hit = self._cache.has(keys["text"]) and self._cache.has(keys["arrows"])
+        return keys, hit
+
+    def _release_when_done(self, fut):
+        # Задача продолжает работать в процессе пула: слот занят, пока она не закончится,
+        # иначе новые запросы копились бы в неограниченной очереди пула за зависшими
+        def release(f):
+            if not f.cancelled():
+                f.exception()  # исключение уже не нужно клиенту — только не оставляем его «неполученным»
+            self.pending -= 1
+        fut.add_done_callback(release)
+
+    async def analyze(self, body, source_name=None):
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise HttpError(503, "Слишком много запросов в работе, повторите позже")
+        self.pending += 1
+        self.stats["requests"] += 1
+        release = True
+        try:
+            img = await asyncio.to_thread(cv2.imdecode, np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise HttpError(400, "Не удалось декодировать изображение")
+
+            loop = asyncio.get_running_loop()
+            keys, hit = await asyncio.to_thread(self._cached, img) if self._cache is not None else (None, False)
+            detection = None
+            if hit:
+                self.stats["cache_hits"] += 1
+            else:
+                fut = loop.create_future()
+                await self._queue.put((img, fut))
+                detection = await fut
+
+            work = asyncio.wrap_future(self._stage_pool.submit(_analyze, img, detection, self.shared_ocr,
+                                                               source_name, keys))
+            try:
+                return await asyncio.wait_for(asyncio.shield(work), STAGE_TIMEOUT_S)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                release = False
+                self._release_when_done(work)
+                raise
+        finally:
+            if release:
+                self.pending -= 1
+
+    def health(self):
+        return dict(self.stats, pending=self.pending, queued=self._queue.qsize())
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    if not request_line:
+        return None
+    method, target, _ = request_line.split(' ', 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_MB * 2 ** 20:
+        raise HttpError(413, "Слишком большое изображение")
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+async def _write_response(writer, status, text, retry_after=None):
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+               500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+    payload = text.encode('utf-8')
+    head = [f"HTTP/1.1 {status} {reasons.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(payload)}",
+            "Connection: close"]
+    if retry_after is not None:
+        head.append(f"Retry-After: {retry_after}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + payload)
+    await writer.drain()
+
+
+def make_handler(service):
+    async def handle(reader, writer):
+        t0 = time.perf_counter()
+        try:
+            try:
+                request = await _read_request(reader)
+                if request is None:
+                    return
+                method, target, headers, body = request
+                path = target.split('?', 1)[0]
+                if method == 'GET' and path == '/health':
+                    await _write_response(writer, 200, json.dumps(service.health()))
+                elif method == 'POST' and path == '/analyze':
+                    result = await service.analyze(body, source_name=headers.get('x-source-name'))
+                    await _write_response(writer, 200, result_to_json(result))
+                    print(f"✅ /analyze {time.perf_counter() - t0:.2f} с")
+                else:
+                    raise HttpError(404, "Неизвестный адрес")
+            except HttpError as e:
+                await _write_response(writer, e.status, json.dumps({"error": str(e)}, ensure_ascii=False),
+                                      retry_after=1 if e.status == 503 else None)
+            except asyncio.TimeoutError:
+                await _write_response(writer, 504, json.dumps({"error": "Превышено время анализа"}, ensure_ascii=False))
+            except Exception as e:
+                await _write_response(writer, 500, json.dumps({"error": str(e)}, ensure_ascii=False))
+        except ConnectionError:
+            pass  # клиент ушел, не дождавшись ответа
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host=HOST, port=PORT, **service_kwargs):
+    service = AnalysisService(**service_kwargs)
+    await service.start()
+    server = await asyncio.start_server(make_handler(service), host, port, backlog=service.max_pending)
+    print(f"🚀 Сервис анализа: http://{host}:{port}/analyze")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный HTTP-сервис анализа BPMN-диаграмм")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=STAGE_WORKERS, help="Процессы для OCR и поиска стрелок")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help="Изображений в одном вызове YOLO")
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW_MS,
+                        help="Сколько ждать попутные запросы для батча")
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING, help="Лимит запросов в работе")
+    parser.add_argument('--shared-ocr', action='store_true', default=SHARED_OCR_DEFAULT)
+    parser.add_argument('--detector', choices=DETECTOR_BACKENDS, default=DETECTOR_BACKEND)
+    parser.add_argument('--int8-data', default=None,
+                        help="Калибровочный YAML для --detector openvino-int8 (по умолчанию data.yaml)")
+    parser.add_argument('--ocr-scale', choices=ocr_pass.OCR_SCALE_CHOICES, default=str(ocr_pass.OCR_SCALE_FACTOR),
+                        help="Масштаб перед OCR: фиксированный x2 или 'auto' по высоте текста")
+    parser.add_argument('--cache', action='store_true', help="Кешировать результаты этапов на диске")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--cache-max-mb', type=float, default=CACHE_MAX_MB)
+    args = parser.parse_args()
+
+    set_detector_backend(args.detector)
+    # Масштаб входит в ключи кеша, которые главный процесс считает до детекции, — задается и здесь, и в воркерах
+    ocr_pass.set_scale_factor(args.ocr_scale)
+    export_detector(args.detector, data=args.int8_data)
+    asyncio.run(serve(args.host, args.port, stage_workers=args.workers, max_batch=args.max_batch,
+                      batch_window_ms=args.batch_window_ms, max_pending=args.max_pending, shared_ocr=args.shared_ocr,
+                      detector_backend=args.detector, cache_dir=args.cache_dir if args.cache else None,
+                      cache_max_mb=args.cache_max_mb))
@@ -1,47 +1,87 @@
 import os
 import random
 import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
+# Способы раскладки файлов по train/val:
+#   hardlink — жесткие ссылки (место на диске не дублируется; между файловыми системами — копия)
+#   symlink  — символические ссылки (на Windows нужны права; при отказе — копия)
+#   copy     — полное копирование
+#   list     — ничего не раскладывается, пишутся списки изображений train.txt / val.txt для YOLO
+MODES = ['hardlink', 'symlink', 'copy', 'list']
+SPLIT_SEED = 42
+COPY_WORKERS = 8
 
-def split_dataset(source_folder, train_size=0.85):
+
+def _place(src, dst, mode):
+    """Кладет src в dst выбранным способом. Возвращает True, если пришлось откатиться на копирование."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode != 'copy':
+        try:
+            if mode == 'hardlink':
+                os.link(src, dst)
+            else:
+                os.symlink(os.path.abspath(src), dst)
+            return False
+        except OSError:
+            pass  # другая файловая система или нет прав на ссылки
+    shutil.copy2(src, dst)
+    return mode != 'copy'
+
+
+def _write_image_list(path, source_folder, names):
+    # YOLO ищет разметку рядом с изображением, если в пути нет каталога images/
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(os.path.abspath(os.path.join(source_folder, name + '.png')) + "\n" for name in names))
+
+
+def split_dataset(source_folder, train_size=0.85, mode='hardlink', seed=SPLIT_SEED, workers=COPY_WORKERS):
     # Путь к новому датасету
     base_dir = os.path.join(os.path.dirname(source_folder), 'dataset')
 
-    # Создаем структуру папок
-    for split in ['train', 'val']:
-        for sub in ['images', 'labels']:
-            os.makedirs(os.path.join(base_dir, split, sub), exist_ok=True)
-
     # Собираем все базовые имена файлов (без расширений)
-    files = [os.path.splitext(f)[0] for f in os.listdir(source_folder) if f.endswith('.png')]
-    random.shuffle(files)  # Перемешиваем для честности
+    files = sorted(os.path.splitext(f)[0] for f in os.listdir(source_folder) if f.endswith('.png'))
+    random.Random(seed).shuffle(files)  # Перемешиваем для честности, но воспроизводимо
 
     split_idx = int(len(files) * train_size)
-    train_files = files[:split_idx]
-    val_files = files[split_idx:]
-
-    def move_files(file_list, target_split):
-        for name in file_list:
-            # Копируем картинку
-            shutil.copy2(
-                os.path.join(source_folder, name + '.png'),
-                os.path.join(base_dir, target_split, 'images', name + '.png')
-            )
-            # Копируем разметку
-            shutil.copy2(
-                os.path.join(source_folder, name + '.txt'),
-                os.path.join(base_dir, target_split, 'labels', name + '.txt')
-            )
-
-    move_files(train_files, 'train')
-    move_files(val_files, 'val')
-
-    print(f"✅ Сплит завершен!")
-    print(f"📈 Train: {len(train_files)} пар")
-    print(f"📉 Val: {len(val_files)} пар")
+    splits = {'train': files[:split_idx], 'val': files[split_idx:]}
+
+    if mode == 'list':
+        os.makedirs(base_dir, exist_ok=True)
+        for split, names in splits.items():
+            _write_image_list(os.path.join(base_dir, split + '.txt'), source_folder, names)
+    else:
+        # Старый сплит убираем целиком: иначе при другом seed файлы окажутся сразу в train и val
+        jobs = []
+        for split, names in splits.items():
+            shutil.rmtree(os.path.join(base_dir, split), ignore_errors=True)
+            for sub, ext in (('images', '.png'), ('labels', '.txt')):
+                os.makedirs(os.path.join(base_dir, split, sub), exist_ok=True)
+                jobs += [(os.path.join(source_folder, name + ext), os.path.join(base_dir, split, sub, name + ext))
+                         for name in names]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fallbacks = sum(pool.map(lambda job: _place(job[0], job[1], mode), jobs))
+        if fallbacks:
+            print(f"⚠️ {fallbacks} файлов скопировано вместо ссылок ({mode} недоступен)")
+
+    print(f"✅ Сплит завершен! (seed={seed}, режим {mode})")
+    print(f"📈 Train: {len(splits['train'])} пар")
+    print(f"📉 Val: {len(splits['val'])} пар")
     print(f"📂 Путь: {base_dir}")
 
 
-# Твоя папка с результатами
-src = r'C:\Users\VelmorSDFG\PycharmProjects\BPMN\uploads\raw\bpmn\02-Results'
-split_dataset(src)
\ No newline at end of file
+if __name__ == "__main__":
+    # Твоя папка с результатами
+    src = r'C:\Users\VelmorSDFG\PycharmProjects\BPMN\uploads\raw\bpmn\02-Results'
+
+    parser = argparse.ArgumentParser(description="Разбиение датасета на train/val")
+    parser.add_argument('source', nargs='?', default=src)
+    parser.add_argument('--train-size', type=float, default=0.85)
+    parser.add_argument('--mode', choices=MODES, default='hardlink')
+    parser.add_argument('--seed', type=int, default=SPLIT_SEED)
+    parser.add_argument('--workers', type=int, default=COPY_WORKERS, help="Потоки для копирования")
+    args = parser.parse_args()
+    split_dataset(args.source, args.train_size, mode=args.mode, seed=args.seed, workers=args.workers)
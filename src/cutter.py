@@ -1,10 +1,9 @@
 import cv2
 import numpy as np
-from paddleocr import PaddleOCR
 import os
-
-# Инициализация OCR
-ocr_ext = PaddleOCR(use_angle_cls=True, lang='ru', show_log=False, det_db_score_mode='fast', det_db_box_thresh=0.4)
+from src.models import EXT_OCR_CONFIG
+from src.ocr_pass import run_full_ocr, assign_lines_to_boxes, auto_tile_size, TILE_WORKERS
+from src.profiling import stage
 
 
 def fix_leaked_letters(text):
@@ -27,35 +26,65 @@ def fix_leaked_letters(text):
     return text
 
 
+MERGE_GRID_CELL = 64  # Размер ячейки пространственной сетки в merge_labels
+
+
 def merge_labels(labels, x_threshold=50, y_threshold=35):
     """Объединяет блоки текста и возвращает их в формате cnt/wh."""
     if not labels: return []
     # Сначала фильтруем вложенные (логика остается той же, работаем с временным bbox)
-    labels.sort(key=lambda b: (b['bbox'][1], b['bbox'][0]))
+    items = sorted(labels, key=lambda b: (b['bbox'][1], b['bbox'][0]))
+    n = len(items)
+    alive = [True] * n
+
+    # Блок кладется во все ячейки, которые покрывает его [x1, x2], в строку сетки по y1
+    c = MERGE_GRID_CELL
+    grid = {}
+    for idx, item in enumerate(items):
+        x1, y1, x2, _ = item['bbox']
+        for gx in range(int(x1 // c), int(x2 // c) + 1):
+            grid.setdefault((gx, int(y1 // c)), []).append(idx)
+
+    def candidates(bbox):
+        # Присоединиться может только блок, чей [x1, x2] задевает [c_x1 - 10, c_x2 + x_threshold],
+        # а y1 меньше max(c_y1 + 12, c_y2 + y_threshold): y1 текущего блока минимален среди оставшихся
+        c_x1, c_y1, c_x2, c_y2 = bbox
+        y_limit = max(c_y1 + 12, c_y2 + y_threshold)
+        found = set()
+        for gy in range(int(c_y1 // c), int(y_limit // c) + 1):
+            for gx in range(int((c_x1 - 10) // c), int((c_x2 + x_threshold) // c) + 1):
+                for idx in grid.get((gx, gy), ()):
+                    if alive[idx] and items[idx]['bbox'][1] < y_limit:
+                        found.add(idx)
+        return sorted(found)
 
     merged_raw = []
-    while labels:
-        curr = labels.pop(0)
-        i = 0
-        while i < len(labels):
-            other = labels[i]
-            c_x1, c_y1, c_x2, c_y2 = curr['bbox']
-            o_x1, o_y1, o_x2, o_y2 = other['bbox']
-
-            is_same_line = abs(c_y1 - o_y1) < 12
-            horizontal_join = is_same_line and -10 < (o_x1 - c_x2) < x_threshold
-
-            y_dist = o_y1 - c_y2
-            overlap_width = min(c_x2, o_x2) - max(c_x1, o_x1)
-            vertical_join = (overlap_width > min(c_x2 - c_x1, o_x2 - o_x1) * 0.5) and 0 <= y_dist < y_threshold
-
-            if horizontal_join or vertical_join:
-                curr['text'] = fix_leaked_letters(f"{curr['text']} {other['text']}")
-                curr['bbox'] = [min(c_x1, o_x1), min(c_y1, o_y1), max(c_x2, o_x2), max(c_y2, o_y2)]
-                labels.pop(i)
-                i = 0
-            else:
-                i += 1
+    for start in range(n):
+        if not alive[start]: continue
+        alive[start] = False
+        curr = {'text': items[start]['text'], 'bbox': list(items[start]['bbox'])}
+
+        # Как и раньше, после каждой склейки ищется первый (в порядке сортировки) подходящий блок
+        joined = True
+        while joined:
+            joined = False
+            for i in candidates(curr['bbox']):
+                c_x1, c_y1, c_x2, c_y2 = curr['bbox']
+                o_x1, o_y1, o_x2, o_y2 = items[i]['bbox']
+
+                is_same_line = abs(c_y1 - o_y1) < 12
+                horizontal_join = is_same_line and -10 < (o_x1 - c_x2) < x_threshold
+
+                y_dist = o_y1 - c_y2
+                overlap_width = min(c_x2, o_x2) - max(c_x1, o_x1)
+                vertical_join = (overlap_width > min(c_x2 - c_x1, o_x2 - o_x1) * 0.5) and 0 <= y_dist < y_threshold
+
+                if horizontal_join or vertical_join:
+                    curr['text'] = fix_leaked_letters(f"{curr['text']} {items[i]['text']}")
+                    curr['bbox'] = [min(c_x1, o_x1), min(c_y1, o_y1), max(c_x2, o_x2), max(c_y2, o_y2)]
+                    alive[i] = False
+                    joined = True
+                    break
         merged_raw.append(curr)
 
     # ПРЕОБРАЗОВАНИЕ В НОВЫЙ ФОРМАТ
@@ -70,48 +99,68 @@ def merge_labels(labels, x_threshold=50, y_threshold=35):
     return final_compact
 
 
-def clean_diagram_v3(img_input, output_dir=None):
-    if isinstance(img_input, str):
-        img = cv2.imread(img_input)
-    else:
-        img = img_input.copy()
-    if img is None: return [], None
-    h, w = img.shape[:2]
-
-    scale_factor = 2
-    upscaled = cv2.resize(img, (w * scale_factor, h * scale_factor), interpolation=cv2.INTER_LANCZOS4)
-    result = ocr_ext.ocr(upscaled, cls=True)
-
+def labels_from_lines(lines, shape, profiler=None):
+    """Строки OCR -> объединенные подписи cnt/wh и маска текста размера shape[:2]."""
+    h, w = shape[:2]
     mask = np.zeros((h, w), dtype=np.uint8)
     raw_labels = []
 
-    if result and result[0]:
-        for line in result[0]:
-            text_content = fix_leaked_letters(line[1][0])
-            score = line[1][1]
-            if len(text_content) < 1: continue
-
-            poly_points = np.array(line[0], dtype=np.float32)
-            poly_orig = (poly_points / scale_factor).astype(np.int32)
-            x1, y1 = np.min(poly_orig, axis=0)
-            x2, y2 = np.max(poly_orig, axis=0)
+    for line in lines:
+        text_content = fix_leaked_letters(line["text"])
+        if len(text_content) < 1: continue
 
-            raw_labels.append({
-                "text": text_content,
-                "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                "confidence": score
-            })
-            cv2.fillPoly(mask, [poly_orig], 255)
+        raw_labels.append({
+            "text": text_content,
+            "bbox": list(line["bbox"]),
+            "confidence": line["score"]
+        })
+        cv2.fillPoly(mask, [line["poly"]], 255)
 
     # Объединяем и переводим в формат cnt/wh
-    final_labels = merge_labels(raw_labels)
+    with stage(profiler, "merge_labels"):
+        return merge_labels(raw_labels), mask
 
-    # Очистка изображения (удаление текста)
-    clean_img = cv2.inpaint(img, mask, 3, cv2.INPAINT_TELEA)
+
+def erase_text(img, mask, profiler=None):
+    with stage(profiler, "inpaint"):
+        clean_img = cv2.inpaint(img, mask, 3, cv2.INPAINT_TELEA)
     clean_img[mask > 0] = (255, 255, 255)
+    return clean_img
+
+
+def shared_ocr_pass(img, node_boxes, profiler=None):
+    """Единый OCR-проход по исходному изображению.
+
+    Строки, центр которых внутри бокса узла, становятся его текстом, остальные — внешними подписями.
+    Возвращает (тексты узлов, подписи cnt/wh, маска внешнего текста).
+    """
+    lines = run_full_ocr(img, EXT_OCR_CONFIG, tile_size=auto_tile_size(img.shape), profiler=profiler)
+    per_box, outside = assign_lines_to_boxes(lines, node_boxes)
+    node_texts = [" ".join(line["text"] for line in box_lines) for box_lines in per_box]
+    final_labels, mask = labels_from_lines(outside, img.shape, profiler=profiler)
+    return node_texts, final_labels, mask
+
+
+def clean_diagram_v3(img_input, output_dir=None, tile_size='auto', tile_workers=TILE_WORKERS, profiler=None):
+    """tile_size: 'auto' — окна только для больших диаграмм, None — всегда целиком, число — размер окна."""
+    if isinstance(img_input, str):
+        img = cv2.imread(img_input)
+    else:
+        # Вход не изменяется: inpaint возвращает новое изображение
+        img = img_input
+    if img is None: return [], None
+
+    if tile_size == 'auto':
+        tile_size = auto_tile_size(img.shape)
+    lines = run_full_ocr(img, EXT_OCR_CONFIG, tile_size=tile_size, tile_workers=tile_workers,
+                         profiler=profiler)
+    final_labels, mask = labels_from_lines(lines, img.shape, profiler=profiler)
+
+    # Очистка изображения (удаление текста)
+    clean_img = erase_text(img, mask, profiler=profiler)
 
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
         cv2.imwrite(os.path.join(output_dir, '2_text_removed.png'), clean_img)
 
-    return final_labels, clean_img
\ No newline at end of file
+    return final_labels, clean_img
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import shutil
+import threading
+
+# Реестр моделей: YOLO и PaddleOCR создаются лениво при первом обращении
+# и переиспользуются всеми этапами пайплайна в рамках процесса.
+
+MODEL_WEIGHTS_PATH = r'best.pt'
+
+# Бэкенд детектора узлов: 'torch' — исходные веса .pt; 'onnx', 'openvino', 'openvino-int8' — экспорт
+# для CPU-серверов (создается рядом с весами при первом обращении). Выход детекции тот же.
+DETECTOR_BACKENDS = ('torch', 'onnx', 'openvino', 'openvino-int8')
+DETECTOR_BACKEND = 'torch'
+EXPORT_IMGSZ = 1024
+# Калибровочный датасет для INT8 по умолчанию (YAML в формате YOLO, например data.yaml из обучения);
+# в CLI — --int8-data
+INT8_CALIBRATION_DATA = 'data.yaml'
+
+# OCR внутри узлов
+NODE_OCR_CONFIG = {'use_angle_cls': True, 'lang': 'ru', 'show_log': False}
+# OCR внешнего текста по всей диаграмме
+EXT_OCR_CONFIG = {'use_angle_cls': True, 'lang': 'ru', 'show_log': False,
+                  'det_db_score_mode': 'fast', 'det_db_box_thresh': 0.4}
+
+_lock = threading.Lock()
+_yolo_models = {}
+_ocr_engines = {}
+
+
+def _config_key(config):
+    return tuple(sorted(config.items()))
+
+
+def exported_weights_path(backend, weights_path=MODEL_WEIGHTS_PATH):
+    """Путь, по которому ultralytics сохраняет экспорт весов для данного бэкенда."""
+    stem = os.path.splitext(weights_path)[0]
+    return {
+        'torch': weights_path,
+        'onnx': stem + '.onnx',
+        'openvino': stem + '_openvino_model',
+        'openvino-int8': stem + '_int8_openvino_model',
+    }[backend]
+
+
+def weights_fingerprint(path):
+    """Отпечаток весов для проверки актуальности: путь, размер и mtime файла (для папки — всех файлов в ней)."""
+    if os.path.isdir(path):
+        return [[os.path.relpath(os.path.join(d, name), path)] + weights_fingerprint(os.path.join(d, name))[1:]
+                for d, _, files in sorted(os.walk(path)) for name in sorted(files)]
+    try:
+        st = os.stat(path)
+    except OSError:
+        return [path]
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+def _export_source_path(path):
+    # Рядом с экспортом: из каких весов и с какими параметрами он сделан
+    return path + '.source.json'
+
+
+def _file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def export_detector(backend, weights_path=MODEL_WEIGHTS_PATH, imgsz=EXPORT_IMGSZ, data=None):
+    """Экспортирует веса .pt в формат бэкенда и возвращает путь к результату.
+
+    Готовый экспорт переиспользуется, только если он сделан из тех же весов .pt с тем же imgsz;
+    после переобучения best.pt экспорт пересоздается.
+    data — калибровочный YAML для INT8: если задан, экспорт должен быть откалиброван на нем (сравнивается
+    содержимое файла, а не путь); None — подходит любой готовый экспорт, новый калибруется на
+    INT8_CALIBRATION_DATA.
+    Экспорт с динамическим размером входа: детекция целиком подает изображения произвольного размера.
+    """
+    path = exported_weights_path(backend, weights_path)
+    if backend == 'torch':
+        return path
+    int8 = backend == 'openvino-int8'
+    source = {"weights": weights_fingerprint(weights_path), "imgsz": imgsz}
+    source_path = _export_source_path(path)
+    if os.path.exists(path) and os.path.exists(source_path):
+        with open(source_path, encoding='utf-8') as f:
+            stored = json.load(f)
+        if (all(stored.get(k) == v for k, v in source.items()) and
+                (not int8 or data is None or stored.get("data") == _file_digest(data))):
+            return path
+
+    data = data or INT8_CALIBRATION_DATA
+    if int8:
+        source["data"] = _file_digest(data)
+        if source["data"] is None:
+            raise FileNotFoundError(f"Нет калибровочного датасета для INT8: {data} (укажите --int8-data)")
+
+    from ultralytics import YOLO
+    if os.path.exists(path):
+        print(f"Экспорт детектора устарел (веса или параметры изменились): {path}")
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    print(f"Экспорт детектора: {backend} -> {path}")
+    model = YOLO(weights_path)
+    if backend == 'onnx':
+        model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    else:
+        model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=int8, data=data if int8 else None)
+    with open(source_path, 'w', encoding='utf-8') as f:
+        json.dump(source, f)
+    # Загруженная ранее модель по этому пути — старая
+    _yolo_models.pop(path, None)
+    return path
+
+
+def get_detector(backend=None, weights_path=MODEL_WEIGHTS_PATH):
+    """Детектор узлов на выбранном бэкенде (по умолчанию DETECTOR_BACKEND)."""
+    backend = backend or DETECTOR_BACKEND
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд детектора: {backend}")
+    with _lock:
+        path = export_detector(backend, weights_path)
+    return get_yolo(path)
+
+
+def get_yolo(weights_path=MODEL_WEIGHTS_PATH):
+    """Возвращает загруженную модель YOLO (загружает при первом вызове)."""
+    with _lock:
+        model = _yolo_models.get(weights_path)
+        if model is None:
+            from ultralytics import YOLO
+            try:
+                # Для экспортированных моделей задачу не из чего вывести — указываем явно
+                model = YOLO(weights_path, task='detect')
+            except Exception as e:
+                raise RuntimeError(f"Ошибка загрузки YOLO: {e}") from e
+            _yolo_models[weights_path] = model
+            print("Модель YOLO загружена")
+    return model
+
+
+def get_ocr(config=NODE_OCR_CONFIG, instance=0):
+    """Возвращает движок PaddleOCR; одинаковые конфиги делят один экземпляр.
+
+    instance > 0 — отдельные копии с тем же конфигом для параллельной работы из нескольких потоков.
+    """
+    key = (_config_key(config), instance)
+    with _lock:
+        engine = _ocr_engines.get(key)
+        if engine is None:
+            from paddleocr import PaddleOCR
+            engine = PaddleOCR(**config)
+            _ocr_engines[key] = engine
+    return engine
+
+
+def set_detector_backend(backend):
+    global DETECTOR_BACKEND
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд детектора: {backend}")
+    DETECTOR_BACKEND = backend
+
+
+def preload(weights_path=MODEL_WEIGHTS_PATH, ocr_configs=(NODE_OCR_CONFIG, EXT_OCR_CONFIG), backend=None):
+    """Явная загрузка всех моделей заранее (для долгоживущих сервисов и воркеров)."""
+    get_detector(backend, weights_path)
+    for config in ocr_configs:
+        get_ocr(config)
@@ -0,0 +1,184 @@
+import cv2
+import queue
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from src.models import get_ocr
+from src.tiling import tile_windows, in_core
+from src.profiling import stage
+
+
+# Тайловый режим: диаграммы больше TILED_OCR_MIN_SIDE распознаются окнами TILE_SIZE с перекрытием TILE_OVERLAP
+# (в пикселях оригинала), чтобы не держать в памяти увеличенную копию всего изображения.
+TILE_SIZE = 1024
+TILE_OVERLAP = 256
+TILED_OCR_MIN_SIDE = 3000
+TILE_WORKERS = 1
+
+
+# Масштаб перед OCR: 'auto' — по оценке высоты текста (см. upscale_factor), число — фиксированный.
+# 'auto' включается вручную: по умолчанию он станет, когда benchmarks/ocr_scale.py покажет, что полнота не падает
+OCR_SCALE_FACTOR = 2
+OCR_SCALE_CHOICES = ('2', 'auto')  # значения --ocr-scale
+# Высота типичного символа (компоненты связности), при которой OCR распознает уверенно: на обычных
+# скриншотах символы ~8 px, что и давало исторический x2; у high-DPI экспортов увеличение не нужно
+TARGET_GLYPH_HEIGHT = 16
+MIN_SCALE, MAX_SCALE = 0.5, 2.0
+SCALE_STEP = 0.25  # Масштаб округляется до шага: стабильные размеры и точный x1
+GLYPH_HEIGHT_RANGE = (4, 80)  # Компоненты вне диапазона — линии, рамки и шум, а не символы
+MIN_GLYPHS = 8  # Меньше символов — оценке не верим, берем масштаб по умолчанию
+
+
+def set_scale_factor(value):
+    """Задает OCR_SCALE_FACTOR из CLI: '2' (или 2) — фиксированный x2, 'auto' — по высоте текста."""
+    global OCR_SCALE_FACTOR
+    if str(value) not in OCR_SCALE_CHOICES:
+        raise ValueError(f"Неизвестный масштаб OCR: {value}")
+    OCR_SCALE_FACTOR = 'auto' if value == 'auto' else int(value)
+
+
+def estimate_text_height(img):
+    """Медианная высота символов (в px) по компонентам связности бинаризованного изображения или None."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    w, h, area = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    lo, hi = GLYPH_HEIGHT_RANGE
+    # Символ: невысокий, не вытянут в линию по горизонтали и заполняет заметную часть своей рамки
+    glyph = (h >= lo) & (h <= hi) & (w <= 2 * h) & (area >= 0.1 * w * h)
+    if np.count_nonzero(glyph) < MIN_GLYPHS:
+        return None
+    return float(np.median(h[glyph]))
+
+
+def upscale_factor(img, default=2):
+    """Масштаб перед OCR, приводящий текст изображения к TARGET_GLYPH_HEIGHT (может быть 1 и меньше 1)."""
+    text_height = estimate_text_height(img)
+    if text_height is None:
+        return default
+    scale = min(MAX_SCALE, max(MIN_SCALE, TARGET_GLYPH_HEIGHT / text_height))
+    scale = round(scale / SCALE_STEP) * SCALE_STEP
+    return int(scale) if scale == int(scale) else scale
+
+
+def crop_scale_factor(crop, default=2):
+    """Масштаб для отдельного фрагмента по настройке OCR_SCALE_FACTOR."""
+    return upscale_factor(crop, default) if OCR_SCALE_FACTOR == 'auto' else OCR_SCALE_FACTOR
+
+
+def auto_tile_size(shape):
+    return TILE_SIZE if max(shape[:2]) > TILED_OCR_MIN_SIDE else None
+
+
+def _ocr_lines(img, engine, scale_factor, interpolation, cls, offset=(0, 0), profiler=None):
+    h, w = img.shape[:2]
+    if scale_factor == 'auto':
+        with stage(profiler, "text_height"):
+            scale_factor = upscale_factor(img)
+    if scale_factor != 1:
+        with stage(profiler, "upscale"):
+            # Уменьшение — через INTER_AREA: интерполяции для увеличения дают алиасинг
+            src = cv2.resize(img, (int(w * scale_factor), int(h * scale_factor)),
+                             interpolation=interpolation if scale_factor > 1 else cv2.INTER_AREA)
+    else:
+        src = img
+    with stage(profiler, "full_ocr"):
+        result = engine.ocr(src, cls=cls)
+
+    lines = []
+    if result and result[0]:
+        for line in result[0]:
+            poly = (np.array(line[0], dtype=np.float32) / scale_factor).astype(np.int32)
+            poly += np.array(offset, dtype=np.int32)
+            x1, y1 = np.min(poly, axis=0)
+            x2, y2 = np.max(poly, axis=0)
+            lines.append({
+                "text": line[1][0],
+                "score": line[1][1],
+                "poly": poly,
+                "bbox": [int(x1), int(y1), int(x2), int(y2)]
+            })
+    return lines
+
+
+def _ocr_tiled(img, ocr_config, scale_factor, interpolation, cls, tile_size, overlap, workers, profiler=None):
+    h, w = img.shape[:2]
+    windows, cores = tile_windows(h, w, tile_size, overlap)
+
+    # Каждое окно в работе получает свободный экземпляр OCR: предиктор Paddle не потокобезопасен
+    free_instances = queue.Queue()
+    for instance in range(workers):
+        free_instances.put(instance)
+
+    def run_tile(k):
+        x0, y0, x1, y1 = windows[k]
+        instance = free_instances.get()
+        try:
+            tile_lines = _ocr_lines(img[y0:y1, x0:x1], get_ocr(ocr_config, instance=instance),
+                                    scale_factor, interpolation, cls, offset=(x0, y0), profiler=profiler)
+        finally:
+            free_instances.put(instance)
+        # Дубликаты из зоны перекрытия: строку оставляет окно, в чью зону владения попал ее центр
+        return [l for l in tile_lines
+                if in_core((l["bbox"][0] + l["bbox"][2]) / 2, (l["bbox"][1] + l["bbox"][3]) / 2, cores[k])]
+
+    if workers > 1:
+        # Не больше workers окон в работе одновременно — пиковая память ограничена
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            per_tile = list(pool.map(run_tile, range(len(windows))))
+    else:
+        per_tile = [run_tile(k) for k in range(len(windows))]
+
+    lines = [l for tile_lines in per_tile for l in tile_lines]
+    # Порядок как у полного прохода Paddle: сверху вниз, слева направо
+    lines.sort(key=lambda l: (l["bbox"][1], l["bbox"][0]))
+    return lines
+
+
+def run_full_ocr(img, ocr_config, scale_factor=None, interpolation=cv2.INTER_LANCZOS4, cls=True,
+                 tile_size=None, tile_overlap=TILE_OVERLAP, tile_workers=TILE_WORKERS, profiler=None):
+    """Один проход OCR по всему изображению. Координаты строк возвращаются в масштабе оригинала.
+
+    scale_factor='auto' подбирает масштаб по высоте текста — для всего изображения или для каждого окна;
+    None — значение OCR_SCALE_FACTOR.
+    При tile_size изображение обрабатывается перекрывающимися окнами (см. src/tiling.py).
+    Строки длиннее перекрытия, пересекающие шов, могут прийти двумя кусками.
+    """
+    if scale_factor is None:
+        scale_factor = OCR_SCALE_FACTOR
+    h, w = img.shape[:2]
+    if tile_size and max(h, w) > tile_size:
+        return _ocr_tiled(img, ocr_config, scale_factor, interpolation, cls, tile_size, tile_overlap,
+                          max(1, tile_workers), profiler=profiler)
+    return _ocr_lines(img, get_ocr(ocr_config), scale_factor, interpolation, cls, profiler=profiler)
+
+
+def assign_lines_to_boxes(lines, boxes):
+    """Раскладывает строки по боксам (x1, y1, x2, y2), внутри которых лежит центр строки.
+
+    Если центр попал в несколько боксов, строка уходит в наименьший из них.
+    Возвращает (списки строк для каждого бокса, строки вне боксов). Порядок строк сохраняется.
+    """
+    per_box = [[] for _ in boxes]
+    outside = []
+    if not lines:
+        return per_box, outside
+    if not boxes:
+        return per_box, list(lines)
+
+    b = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    centers = np.array([[(l["bbox"][0] + l["bbox"][2]) / 2, (l["bbox"][1] + l["bbox"][3]) / 2] for l in lines],
+                       dtype=np.float32)
+
+    inside = ((centers[:, None, 0] >= b[None, :, 0]) & (centers[:, None, 0] <= b[None, :, 2]) &
+              (centers[:, None, 1] >= b[None, :, 1]) & (centers[:, None, 1] <= b[None, :, 3]))
+    masked_areas = np.where(inside, areas[None, :], np.inf)
+    owner = np.argmin(masked_areas, axis=1)
+    has_owner = inside.any(axis=1)
+
+    for idx, line in enumerate(lines):
+        if has_owner[idx]:
+            per_box[owner[idx]].append(line)
+        else:
+            outside.append(line)
+    return per_box, outside
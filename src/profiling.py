@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Замеры этапов пайплайна: wall time, CPU time и память (RSS).
+# CPU по умолчанию — всего процесса (включая внутренние потоки Paddle/torch). Если этапы разных изображений
+# идут одновременно в разных потоках (потоковый режим), CPU процесса смешал бы их — там берется CPU потока
+# этапа (cpu_scope='thread'); работа внутренних потоков нативных библиотек в него не попадает.
+# Пиковый RSS этапа — максимум RSS процесса за время этапа: пока открыт хоть один этап, общий фоновый поток
+# опрашивает RSS каждые RSS_POLL_S (ОС не умеет сбрасывать пик процесса между этапами). Пики короче
+# интервала опроса могут быть пропущены. Рядом пишется прирост текущего RSS за этап.
+
+RSS_POLL_S = 0.005
+
+
+def _rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдает килобайты, macOS — байты
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 2 ** 20
+    return None
+
+
+class _RssSampler:
+    """Один поток на процесс: опрашивает RSS и поднимает пики всех открытых замеров."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {}
+        self._thread = None
+
+    def open(self):
+        rss = _rss_mb()
+        if rss is None:
+            return None
+        peak = [rss]
+        with self._lock:
+            self._open[id(peak)] = peak
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return peak
+
+    def close(self, peak):
+        with self._lock:
+            self._open.pop(id(peak), None)
+        return max(peak[0], _rss_mb())
+
+    def _run(self):
+        while True:
+            time.sleep(RSS_POLL_S)
+            with self._lock:
+                if not self._open:
+                    self._thread = None
+                    return
+                peaks = list(self._open.values())
+            rss = _rss_mb()
+            for peak in peaks:
+                if rss > peak[0]:
+                    peak[0] = rss
+
+
+_sampler = _RssSampler()
+
+
+@contextmanager
+def rss_peak():
+    """Пик RSS (МБ) за время блока: with rss_peak() as peak: ...; после выхода peak['mb'] (None — RSS недоступен)."""
+    result = {"mb": None}
+    peak = _sampler.open()
+    try:
+        yield result
+    finally:
+        if peak is not None:
+            result["mb"] = _sampler.close(peak)
+
+
+class StageProfiler:
+    """Собирает замеры вложенных этапов: with profiler.stage('ocr'): ..."""
+
+    def __init__(self, cpu_scope='process'):
+        if cpu_scope not in ('process', 'thread'):
+            raise ValueError(f"Неизвестный cpu_scope: {cpu_scope}")
+        self.cpu_scope = cpu_scope
+        self._cpu_time = time.thread_time if cpu_scope == 'thread' else time.process_time
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        full_name = "/".join(stack)
+
+        rss_before = _rss_mb()
+        peak = _sampler.open()
+        t_wall, t_cpu = time.perf_counter(), self._cpu_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - t_wall, self._cpu_time() - t_cpu
+            peak_rss = _sampler.close(peak) if peak is not None else _peak_rss_mb()
+            rss_after = _rss_mb()
+            stack.pop()
+            with self._lock:
+                self.records.append({
+                    "stage": full_name,
+                    "wall_s": round(wall, 6),
+                    "cpu_s": round(cpu, 6),
+                    "peak_rss_mb": peak_rss,
+                    "rss_delta_mb": None if rss_before is None or rss_after is None else rss_after - rss_before,
+                })
+
+    def summary(self):
+        """Суммы по именам этапов (повторные вызовы, например окна OCR, складываются)."""
+        stages = {}
+        for rec in self.records:
+            s = stages.setdefault(rec["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "cpu_scope": self.cpu_scope,
+                                                 "peak_rss_mb": None})
+            s["calls"] += 1
+            s["wall_s"] += rec["wall_s"]
+            s["cpu_s"] += rec["cpu_s"]
+            if rec["peak_rss_mb"] is not None:
+                s["peak_rss_mb"] = max(s["peak_rss_mb"] or 0.0, rec["peak_rss_mb"])
+        return stages
+
+
+def stage(profiler, name):
+    """Замер этапа, если профилировщик передан; иначе пустой контекст."""
+    return profiler.stage(name) if profiler is not None else nullcontext()
+
+
+def aggregate_profiles(summaries):
+    """Сводка по пакету: summaries — список StageProfiler.summary() отдельных изображений."""
+    per_stage = {}
+    for summary in summaries:
+        for name, s in summary.items():
+            per_stage.setdefault(name, []).append(s)
+
+    report = {}
+    for name, items in sorted(per_stage.items()):
+        wall = np.array([s["wall_s"] for s in items])
+        cpu = np.array([s["cpu_s"] for s in items])
+        peaks = [s["peak_rss_mb"] for s in items if s["peak_rss_mb"] is not None]
+        report[name] = {
+            "images": len(items),
+            "wall_total_s": float(wall.sum()),
+            "wall_mean_s": float(wall.mean()),
+            "wall_p50_s": float(np.percentile(wall, 50)),
+            "wall_p95_s": float(np.percentile(wall, 95)),
+            "cpu_total_s": float(cpu.sum()),
+            "cpu_scope": items[0].get("cpu_scope", "process"),
+            "peak_rss_max_mb": max(peaks) if peaks else None,
+        }
+    return report
@@ -0,0 +1,165 @@
+import os
+import json
+import zlib
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+
+# Кеш результатов этапов пайплайна на диске.
+# Ключ этапа = хеш пикселей изображения + веса модели + параметры этого этапа и всех предыдущих,
+# поэтому смена, например, только параметров стрелок переиспользует закешированные узлы и подписи.
+# Записи — отдельные файлы; время последнего доступа хранится в mtime, при превышении лимита
+# удаляются самые давно использованные (LRU). Запись атомарна, кеш можно делить между процессами.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'results')
+CACHE_MAX_MB = 2048
+# Увеличить при изменении формата записей или логики этапов, не отраженной в параметрах
+CACHE_VERSION = 2
+# Размер кеша ведется счетчиком; полный обход каталога — при превышении лимита и раз в столько записей
+# (учесть записи других процессов, делящих кеш)
+RESCAN_EVERY = 512
+# Вытеснение освобождает место с запасом — до этой доли лимита, чтобы следующие записи не вызывали обход
+EVICT_TO = 0.9
+
+
+class ResultCache:
+    def __init__(self, root=CACHE_DIR, max_mb=CACHE_MAX_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self._size = None  # байт в кеше по последнему обходу плюс свои записи после него
+        self._puts = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.bin')
+
+    def get(self, key):
+        """Значение по ключу или None при промахе."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # отметка использования для LRU
+        except OSError:
+            return None
+        try:
+            return pickle.loads(zlib.decompress(data))
+        except Exception:
+            return None  # поврежденная запись — считаем промахом, перезапишется
+
+    def has(self, key):
+        """Есть ли запись (без чтения и без отметки использования)."""
+        return os.path.exists(self._path(key))
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Диаграммы в основном белые: даже быстрое сжатие уменьшает картинки этапов в десятки раз
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        self._puts += 1
+        if self._size is None or self._puts % RESCAN_EVERY == 0:
+            self.evict()
+        else:
+            self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Обходит кеш; если он больше лимита, удаляет самые давно использованные записи до EVICT_TO лимита."""
+        entries, total = [], 0
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith('.bin'): continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue  # удалил параллельный процесс
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+        self._size = total
+
+
+def image_hash(img):
+    """Хеш содержимого: одинаковая картинка из файла и из памяти дает один ключ."""
+    h = hashlib.sha256(str(img.shape).encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+def _key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _nodes_params():
+    from src import models, ocr_pass, test_model
+    return {
+        "weights": models.weights_fingerprint(models.MODEL_WEIGHTS_PATH),
+        "detector_backend": models.DETECTOR_BACKEND,
+        # Экспорт может быть пересоздан из тех же весов — его отпечаток тоже часть ключа
+        "detector_export": models.weights_fingerprint(models.exported_weights_path(models.DETECTOR_BACKEND)),
+        "ocr": models.NODE_OCR_CONFIG,
+        "conf": test_model.CONFIDENCE_THRESHOLD,
+        "ocr_mode": test_model.NODE_OCR_MODE,
+        "padding": test_model.NODE_PADDING,
+        "ocr_policy": [test_model.NODE_OCR_POLICY, sorted(test_model.NO_ANGLE_CLS_CLASSES),
+                       test_model.INK_INNER_MARGIN, test_model.INK_DARK_THRESHOLD, test_model.INK_DENSITY_MIN],
+        "yolo_tiles": [test_model.YOLO_TILE_SIZE, test_model.YOLO_TILE_OVERLAP, test_model.YOLO_TILED_MIN_SIDE,
+                       test_model.YOLO_TILE_NMS_IOU, test_model.YOLO_SEAM_MARGIN, test_model.YOLO_SEAM_COVERED],
+        "ocr_tiles": [ocr_pass.TILE_SIZE, ocr_pass.TILE_OVERLAP, ocr_pass.TILED_OCR_MIN_SIDE],
+        "ocr_scale": _ocr_scale_params(),
+    }
+
+
+def _ocr_scale_params():
+    from src import ocr_pass
+    return [ocr_pass.OCR_SCALE_FACTOR, ocr_pass.TARGET_GLYPH_HEIGHT, ocr_pass.MIN_SCALE, ocr_pass.MAX_SCALE,
+            ocr_pass.SCALE_STEP, ocr_pass.GLYPH_HEIGHT_RANGE, ocr_pass.MIN_GLYPHS]
+
+
+def _text_params():
+    from src import models
+    return {"ocr": models.EXT_OCR_CONFIG, "ocr_scale": _ocr_scale_params()}
+
+
+def _arrows_params():
+    from src import slip_arrows
+    return [slip_arrows.SPHERE_RADIUS, slip_arrows.RECT_MARGIN, slip_arrows.INTERNAL_END_RADIUS,
+            slip_arrows.INTERNAL_RECT_MARGIN, slip_arrows.TIP_RADIUS]
+
+
+def pipeline_keys(img, shared_ocr, batched_detection=False):
+    """Ключи этапов run_smart_pipeline; каждый следующий включает ключ предыдущего.
+
+    batched_detection — узлы получены пакетной детекцией (letterbox-корзины): ее боксы могут немного
+    отличаться от поштучной, поэтому ключи у них разные.
+    """
+    from src import test_model
+    base = [CACHE_VERSION, image_hash(img)]
+    nodes_params = _nodes_params()
+    if batched_detection:
+        nodes_params["batch_buckets"] = list(test_model.YOLO_BATCH_BUCKETS)
+    nodes = _key(base, "nodes", nodes_params)
+    text = _key(nodes, "text", _text_params(), bool(shared_ocr))
+    arrows = _key(text, "arrows", _arrows_params())
+    return {"nodes": nodes, "text": text, "text_image": _key(text, "image"), "arrows": arrows}
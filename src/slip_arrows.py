@@ -1,20 +1,153 @@
 import cv2
 import numpy as np
 import os
-import math
-
-def detect_orthogonal_arrows(img_input, output_dir=None):
+from collections import defaultdict, deque
+from src.profiling import stage
+
+SPHERE_RADIUS = 15  # Радиус склейки концов сегментов
+RECT_MARGIN = 5  # Допуск попадания конца сегмента в рамку другого
+RECT_GRID_CELL = 64  # Размер ячейки сетки для рамок
+INTERNAL_END_RADIUS = 12  # Конец ближе этого к концу другого сегмента группы — внутренний
+INTERNAL_RECT_MARGIN = 8  # Допуск попадания конца в рамку другого сегмента группы
+TIP_RADIUS = 15  # Полуразмер окна плотности пикселей для выбора наконечника
+
+
+def _close_end_pairs(ends, radius, strict=False):
+    """Пары индексов концов (a < b) на расстоянии <= radius (< radius при strict)."""
+    r = max(int(radius), 1)
+    r2 = radius * radius
+    grid = defaultdict(list)
+    for idx, (px, py) in enumerate(ends):
+        grid[(px // r, py // r)].append(idx)
+
+    pairs = []
+    for (cx, cy), bucket in grid.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                other = grid.get((cx + dx, cy + dy))
+                if not other: continue
+                for a in bucket:
+                    ax, ay = ends[a]
+                    for b in other:
+                        if a >= b: continue
+                        d2 = (ax - ends[b][0]) ** 2 + (ay - ends[b][1]) ** 2
+                        if (d2 < r2) if strict else (d2 <= r2):
+                            pairs.append((a, b))
+    return pairs
+
+
+def _end_in_rect_pairs(ends, rects, margin):
+    """Пары (индекс конца, индекс рамки), где конец попадает в рамку с допуском margin."""
+    c = RECT_GRID_CELL
+    grid = defaultdict(list)
+    for j, (bx, by, bw, bh) in enumerate(rects):
+        for gx in range((bx - margin) // c, (bx + bw + margin) // c + 1):
+            for gy in range((by - margin) // c, (by + bh + margin) // c + 1):
+                grid[(gx, gy)].append(j)
+
+    pairs = []
+    for e, (px, py) in enumerate(ends):
+        for j in grid.get((px // c, py // c), ()):
+            bx, by, bw, bh = rects[j]
+            if bx - margin <= px <= bx + bw + margin and by - margin <= py <= by + bh + margin:
+                pairs.append((e, j))
+    return pairs
+
+
+def _segment_pairs(raw_segments, sphere_radius=SPHERE_RADIUS, rect_margin=RECT_MARGIN):
+    """Связанные пары сегментов (i < j) через сеточный индекс вместо перебора всех пар."""
+    ends = [p for seg in raw_segments for p in seg['ends']]
+    rects = [seg['rect'] for seg in raw_segments]
+    pairs = set()
+
+    # Концы ближе sphere_radius
+    for a, b in _close_end_pairs(ends, sphere_radius):
+        i, j = a // 2, b // 2
+        if i != j:
+            pairs.add((min(i, j), max(i, j)))
+
+    # Конец одного сегмента внутри рамки другого
+    for e, j in _end_in_rect_pairs(ends, rects, rect_margin):
+        i = e // 2
+        if i != j:
+            pairs.add((min(i, j), max(i, j)))
+    return pairs
+
+
+def _group_segments(num_segments, pairs):
+    """BFS по графу пар: группы — списки индексов сегментов в порядке обхода, и метка группы каждого сегмента.
+
+    Соседи добавляются в множества в том же порядке, что и при переборе всех пар, поэтому порядок обхода
+    (а с ним выбор наконечника при равной плотности и порядок starts) совпадает с исходным BFS.
+    """
+    adj = [set() for _ in range(num_segments)]
+    for i, j in sorted(pairs):
+        adj[i].add(j)
+        adj[j].add(i)
+
+    labels = np.full(num_segments, -1, dtype=np.int64)
+    groups = []
+    for i in range(num_segments):
+        if labels[i] >= 0: continue
+        labels[i] = len(groups)
+        group, queue = [], deque([i])
+        while queue:
+            curr = queue.popleft()
+            group.append(curr)
+            for n in adj[curr]:
+                if labels[n] < 0:
+                    labels[n] = len(groups)
+                    queue.append(n)
+        groups.append(group)
+    return groups, labels
+
+
+def _external_end_mask(raw_segments, labels):
+    """Внешние концы: нет конца другого сегмента группы ближе INTERNAL_END_RADIUS и не попадает в его рамку."""
+    ends = [p for seg in raw_segments for p in seg['ends']]
+    rects = [seg['rect'] for seg in raw_segments]
+    owner = np.repeat(np.arange(len(raw_segments)), 2)
+    internal = np.zeros(len(ends), dtype=bool)
+
+    close = np.array(_close_end_pairs(ends, INTERNAL_END_RADIUS, strict=True), dtype=np.int64).reshape(-1, 2)
+    if len(close):
+        a, b = close[:, 0], close[:, 1]
+        keep = (owner[a] != owner[b]) & (labels[owner[a]] == labels[owner[b]])
+        internal[a[keep]] = True
+        internal[b[keep]] = True
+
+    inside = np.array(_end_in_rect_pairs(ends, rects, INTERNAL_RECT_MARGIN), dtype=np.int64).reshape(-1, 2)
+    if len(inside):
+        e, j = inside[:, 0], inside[:, 1]
+        keep = (owner[e] != j) & (labels[owner[e]] == labels[j])
+        internal[e[keep]] = True
+
+    return np.array(ends, dtype=np.int64).reshape(-1, 2), ~internal
+
+
+def _window_density(binary, points, r=TIP_RADIUS):
+    """Число ненулевых пикселей в окне [y-r, y+r) x [x-r, x+r) для всех точек разом (интегральное изображение)."""
+    h, w = binary.shape[:2]
+    integral = cv2.integral((binary > 0).astype(np.uint8), sdepth=cv2.CV_32S)
+    x, y = points[:, 0], points[:, 1]
+    x0, x1 = np.clip(x - r, 0, w), np.clip(x + r, 0, w)
+    y0, y1 = np.clip(y - r, 0, h), np.clip(y + r, 0, h)
+    return integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+
+
+def detect_orthogonal_arrows(img_input, output_dir=None, profiler=None):
     if isinstance(img_input, str):
         img = cv2.imread(img_input)
     else:
-        img = img_input.copy()
+        img = img_input
 
     if img is None: return []
 
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
                                    cv2.THRESH_BINARY_INV, 11, 2)
-    output = img.copy()
+    # Копия под отрисовку нужна только для отладочной картинки
+    output = img.copy() if output_dir else None
 
     # --- 1. Поиск базовых линий ---
     def find_lines_by_direction(mask, direction='h'):
@@ -33,84 +166,37 @@ def detect_orthogonal_arrows(img_input, output_dir=None):
             results.append({'rect': [int(x), int(y), int(w), int(h)], 'ends': ends, 'dir': direction.upper()})
         return results
 
-    raw_segments = find_lines_by_direction(binary, 'h') + find_lines_by_direction(binary, 'v')
+    with stage(profiler, "line_morphology"):
+        raw_segments = find_lines_by_direction(binary, 'h') + find_lines_by_direction(binary, 'v')
     num_segments = len(raw_segments)
     if num_segments == 0: return []
 
     # --- 2. Построение графа связей ---
-    adj = {i: set() for i in range(num_segments)}
-    sphere_radius = 15
-
-    for i in range(num_segments):
-        seg_a = raw_segments[i]
-        for j in range(i + 1, num_segments):
-            seg_b = raw_segments[j]
-            is_connected = False
-
-            for p_a in seg_a['ends']:
-                for p_b in seg_b['ends']:
-                    if math.sqrt((p_a[0] - p_b[0]) ** 2 + (p_a[1] - p_b[1]) ** 2) <= sphere_radius:
-                        is_connected = True; break
-                if is_connected: break
-
-            if not is_connected:
-                for p_a in seg_a['ends']:
-                    bx, by, bw, bh = seg_b['rect']
-                    if (bx - 5 <= p_a[0] <= bx + bw + 5 and by - 5 <= p_a[1] <= by + bh + 5):
-                        is_connected = True; break
-                if not is_connected:
-                    for p_b in seg_b['ends']:
-                        ax, ay, aw, ah = seg_a['rect']
-                        if (ax - 5 <= p_b[0] <= ax + aw + 5 and ay - 5 <= p_b[1] <= ay + ah + 5):
-                            is_connected = True; break
-            if is_connected:
-                adj[i].add(j); adj[j].add(i)
+    with stage(profiler, "adjacency"):
+        pairs = _segment_pairs(raw_segments)
 
     # --- 3. Группировка (BFS) ---
-    groups = []
-    visited = set()
-    for i in range(num_segments):
-        if i not in visited:
-            group = []; queue = [i]; visited.add(i)
-            while queue:
-                curr = queue.pop(0)
-                group.append(raw_segments[curr])
-                for n in adj[curr]:
-                    if n not in visited: visited.add(n); queue.append(n)
-            groups.append(group)
+    with stage(profiler, "grouping"):
+        groups, labels = _group_segments(num_segments, pairs)
 
     # --- 4. Анализ и Фильтрация пустых стрелок ---
+    with stage(profiler, "end_analysis"):
+        ends, is_external = _external_end_mask(raw_segments, labels)
+        density = np.zeros(len(ends), dtype=np.int64)
+        density[is_external] = _window_density(binary, ends[is_external])
+
     arrows_final_data = []
 
-    for g_idx, group in enumerate(groups):
-        external_ends = []
-        for seg in group:
-            for ex, ey in seg['ends']:
-                is_internal = False
-                neighbor_count = 0
-                for other_seg in group:
-                    if other_seg is seg: continue
-                    ox, oy, ow, oh = other_seg['rect']
-                    if (ox - 8 <= ex <= ox + ow + 8 and oy - 8 <= ey <= oy + oh + 8):
-                        neighbor_count += 1
-                    for p_o in other_seg['ends']:
-                        if math.sqrt((ex - p_o[0]) ** 2 + (ey - p_o[1]) ** 2) < 12:
-                            is_internal = True; break
-                    if is_internal: break
-
-                if neighbor_count > 0: is_internal = True
-                if not is_internal: external_ends.append((int(ex), int(ey)))
-
-        # Определение TIP
+    for group in groups:
+        # Внешние концы в порядке обхода группы
+        sel = [e for i in group for e in (2 * i, 2 * i + 1) if is_external[e]]
+        external_ends = [(int(ex), int(ey)) for ex, ey in ends[sel]]
+
+        # Определение TIP — первый конец с максимальной плотностью
         best_tip = None
-        max_density = -1
-        for ex, ey in external_ends:
-            r = 15
-            roi = binary[max(0, ey - r):ey + r, max(0, ex - r):ex + r]
-            density = cv2.countNonZero(roi)
-            if density > max_density:
-                max_density = density
-                best_tip = [ex, ey]
+        if sel:
+            ex, ey = external_ends[int(np.argmax(density[sel]))]
+            best_tip = [ex, ey]
 
         # STARTS — внешние концы без учета tip
         start_points = [p for p in external_ends if p != best_tip]
@@ -126,8 +212,8 @@ def detect_orthogonal_arrows(img_input, output_dir=None):
             # Отрисовка  валидных стрелок
             if output_dir:
                 base_color = (int(np.random.randint(50, 200)), int(np.random.randint(50, 200)), int(np.random.randint(50, 200)))
-                for seg in group:
-                    x, y, w, h = seg['rect']
+                for i in group:
+                    x, y, w, h = raw_segments[i]['rect']
                     cv2.rectangle(output, (x, y), (x + w, y + h), base_color, 2)
                 if best_tip:
                     cv2.circle(output, (best_tip[0], best_tip[1]), 7, (0, 255, 0), -1)
@@ -138,4 +224,4 @@ def detect_orthogonal_arrows(img_input, output_dir=None):
         os.makedirs(output_dir, exist_ok=True)
         cv2.imwrite(os.path.join(output_dir, '4_detected_arrows_final.png'), output)
 
-    return arrows_final_data
\ No newline at end of file
+    return arrows_final_data
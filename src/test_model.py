@@ -1,21 +1,47 @@
 import cv2
 import os
-from ultralytics import YOLO
-from paddleocr import PaddleOCR
+import numpy as np
+from src.models import NODE_OCR_CONFIG, get_ocr, get_detector
+from src.ocr_pass import run_full_ocr, assign_lines_to_boxes, auto_tile_size, crop_scale_factor
+from src.tiling import tile_windows
+from src.profiling import stage
 
-# Инициализация OCR
-ocr_local = PaddleOCR(use_angle_cls=True, lang='ru', show_log=False)
-
-MODEL_WEIGHTS_PATH = r'best.pt'
 CONFIDENCE_THRESHOLD = 0.5
-CLEAN_DIR = r'C:\Users\VelmorSDFG\PycharmProjects\BPMN\src\result'
 
-try:
-    model = YOLO(MODEL_WEIGHTS_PATH)
-    print("Модель YOLO загружена")
-except Exception as e:
-    print(f"Ошибка загрузки YOLO: {e}")
-    exit()
+# 'batched' — один OCR-проход по всей диаграмме с раскладкой строк по узлам,
+# 'per_node' — отдельный OCR для каждого узла (старое поведение)
+NODE_OCR_MODE = 'batched'
+NODE_PADDING = 4  # Увеличенный отступ для OCR
+
+# OCR внутри узла по классу: 'full' — всегда, 'ink' — только если внутри фигуры есть «чернила»,
+# 'skip' — никогда (события и шлюзы почти не содержат текста внутри). Неизвестные классы — 'full'.
+NODE_OCR_POLICY = {'Task': 'full', 'Gateway': 'skip', 'StartEvent': 'ink', 'EndEvent': 'ink',
+                   'IntermediateEvent': 'ink'}
+# Классификатор поворота текста не нужен для горизонтальных надписей в прямоугольниках задач
+NO_ANGLE_CLS_CLASSES = {'Task'}
+# Предпроверка 'ink': доля темных пикселей в центральной части бокса (без контура фигуры)
+INK_INNER_MARGIN = 0.25  # Отступ от краев бокса в долях его стороны: центр круга/ромба без обводки
+INK_DARK_THRESHOLD = 128
+INK_DENSITY_MIN = 0.02
+
+# Тайловый YOLO для огромных холстов: окна YOLO_TILE_SIZE с перекрытием YOLO_TILE_OVERLAP,
+# по YOLO_TILE_BATCH окон за вызов predict. Узел, обрезанный швом, берется из окна, где он виден целиком,
+# а узлы крупнее перекрытия (развернутые подпроцессы) склеиваются из обрезков соседних окон
+YOLO_TILE_SIZE = 1024
+YOLO_TILE_OVERLAP = 256
+YOLO_TILED_MIN_SIDE = 3000
+YOLO_TILE_BATCH = 8
+YOLO_TILE_NMS_IOU = 0.5
+YOLO_SEAM_MARGIN = 2
+YOLO_SEAM_COVERED = 0.8  # Обрезок лишний, если целый бокс того же класса покрывает такую долю его площади
+
+
+# Пакетная детекция (сервис): изображения разных размеров приводятся letterbox к общему квадрату imgsz —
+# наименьшей корзине не меньше длинной стороны, — и каждая корзина идет одним вызовом predict.
+# Относительно одиночного вызова (imgsz по размеру изображения, без масштаба) картинка увеличивается
+# не больше чем в 1.6 раза и дополняется полями, поэтому боксы могут сдвинуться на пару пикселей,
+# а пограничные по уверенности узлы — появиться или пропасть.
+YOLO_BATCH_BUCKETS = (640, 1024, 1600, 2400, 3008)
 
 
 def simple_text_clean(text):
@@ -25,63 +51,322 @@ def simple_text_clean(text):
     return text.strip()
 
 
-def predict_and_show(image_path):
-    if not os.path.exists(image_path):
-        return [], None
+def _has_ink(img, box):
+    x1, y1, x2, y2 = box
+    mx, my = int((x2 - x1) * INK_INNER_MARGIN), int((y2 - y1) * INK_INNER_MARGIN)
+    inner = img[y1 + my:y2 - my, x1 + mx:x2 - mx]
+    if inner.size == 0:
+        return False
+    gray = cv2.cvtColor(inner, cv2.COLOR_BGR2GRAY) if inner.ndim == 3 else inner
+    return np.count_nonzero(gray < INK_DARK_THRESHOLD) >= INK_DENSITY_MIN * gray.size
 
-    img = cv2.imread(image_path)
-    if img is None: return [], None
 
-    clean_img = img.copy()
-    debug_img = img.copy()
-    h, w = img.shape[:2]
+def node_ocr_plan(img, detections, profiler=None):
+    """Для каждого узла: None — OCR не нужен, иначе значение cls (классификатор поворота) для PaddleOCR."""
+    plan = []
+    with stage(profiler, "ocr_policy"):
+        for label, box in detections:
+            policy = NODE_OCR_POLICY.get(label, 'full')
+            if policy == 'skip' or (policy == 'ink' and not _has_ink(img, box)):
+                plan.append(None)
+            else:
+                plan.append(label not in NO_ANGLE_CLS_CLASSES)
+    return plan
 
-    new_h, new_w = int((h + 31) // 32 * 32), int((w + 31) // 32 * 32)
-    results = model.predict(source=image_path, conf=CONFIDENCE_THRESHOLD, imgsz=(new_h, new_w), verbose=False)
 
-    nodes_data = []
-    p = 4  # Увеличенный отступ для OCR
+def _ocr_per_node(img, padded_boxes, ocr_engine, plan, profiler=None):
+    texts = []
+    for (x1_p, y1_p, x2_p, y2_p), cls in zip(padded_boxes, plan):
+        node_crop = img[y1_p:y2_p, x1_p:x2_p]
+        node_text = ""
+        if cls is not None and node_crop.size > 0:
+            k = crop_scale_factor(node_crop)
+            if k == 1:
+                crop_res = node_crop
+            else:
+                crop_res = cv2.resize(node_crop, (0, 0), fx=k, fy=k,
+                                      interpolation=cv2.INTER_CUBIC if k > 1 else cv2.INTER_AREA)
+            with stage(profiler, "node_ocr"):
+                ocr_res = ocr_engine.ocr(crop_res, cls=cls)
+            if ocr_res and ocr_res[0]:
+                node_text = " ".join([line[1][0] for line in ocr_res[0]])
+        texts.append(node_text)
+    return texts
+
+
+def _ocr_input(img, padded_boxes, plan):
+    """Изображение для общего прохода: видны только узлы, которым нужен OCR, остальное залито фоном.
+
+    Картинка обрезается по общей рамке этих узлов. Возвращает (изображение, смещение (x0, y0)).
+    """
+    need = [box for box, cls in zip(padded_boxes, plan) if cls is not None]
+    x0, y0 = min(b[0] for b in need), min(b[1] for b in need)
+    x1, y1 = max(b[2] for b in need) + 1, max(b[3] for b in need) + 1
+    # Фон — медианный цвет по разреженной сетке пикселей (диаграммы почти целиком фон)
+    background = np.median(img[::8, ::8].reshape(-1, img.shape[2] if img.ndim == 3 else 1), axis=0)
+    canvas = np.empty((y1 - y0, x1 - x0) + img.shape[2:], dtype=img.dtype)
+    canvas[:] = background.astype(img.dtype).reshape(img.shape[2:])
+    for bx1, by1, bx2, by2 in need:
+        canvas[by1 - y0:by2 - y0 + 1, bx1 - x0:bx2 - x0 + 1] = img[by1:by2 + 1, bx1:bx2 + 1]
+    return canvas, (x0, y0)
+
+
+def _recognize_line_with_cls(img, line, engine):
+    # Повторное распознавание одной строки с классификатором поворота (без детекции)
+    x1, y1, x2, y2 = line["bbox"]
+    crop = img[max(0, y1):y2 + 1, max(0, x1):x2 + 1]
+    if crop.size == 0:
+        return line["text"]
+    k = crop_scale_factor(crop)
+    if k != 1:
+        crop = cv2.resize(crop, (0, 0), fx=k, fy=k, interpolation=cv2.INTER_CUBIC if k > 1 else cv2.INTER_AREA)
+    res = engine.ocr(crop, det=False, cls=True)
+    return res[0][0][0] if res and res[0] else line["text"]
+
+
+def _ocr_batched(img, padded_boxes, plan, profiler=None):
+    # Один проход детектора+распознавателя вместо отдельного вызова на каждый узел — только по узлам,
+    # которым OCR нужен (остальные залиты фоном), и без классификатора поворота. Строки узлов, которым
+    # он нужен (события и неизвестные классы), распознаются повторно по одной с cls — их единицы.
+    if all(cls is None for cls in plan):
+        return ["" for _ in padded_boxes]
+    with stage(profiler, "ocr_mask"):
+        ocr_img, (x0, y0) = _ocr_input(img, padded_boxes, plan)
+    lines = run_full_ocr(ocr_img, NODE_OCR_CONFIG, interpolation=cv2.INTER_CUBIC,
+                         cls=False, tile_size=auto_tile_size(ocr_img.shape), profiler=profiler)
+    for line in lines:
+        line["poly"] = line["poly"] + np.array([x0, y0], dtype=line["poly"].dtype)
+        bx1, by1, bx2, by2 = line["bbox"]
+        line["bbox"] = [bx1 + x0, by1 + y0, bx2 + x0, by2 + y0]
+    per_box, _ = assign_lines_to_boxes(lines, padded_boxes)
 
-    if results and results[0].boxes:
-        for i, box in enumerate(results[0].boxes):
+    texts = []
+    for box_lines, cls in zip(per_box, plan):
+        if cls is None:
+            # Строки в узлах без OCR отбрасываются так же, как если бы их не распознавали
+            texts.append("")
+            continue
+        if cls and box_lines:
+            with stage(profiler, "angle_cls"):
+                engine = get_ocr(NODE_OCR_CONFIG)
+                texts.append(" ".join(_recognize_line_with_cls(img, line, engine) for line in box_lines))
+        else:
+            texts.append(" ".join(line["text"] for line in box_lines))
+    return texts
+
+
+def _full_imgsz(shape):
+    h, w = shape[:2]
+    return int((h + 31) // 32 * 32), int((w + 31) // 32 * 32)
+
+
+def _parse_result(result):
+    detections = []
+    if result.boxes:
+        for box in result.boxes:
             cls_id = int(box.cls[0])
-            label = results[0].names[cls_id]
+            label = result.names[cls_id]
             x1, y1, x2, y2 = map(int, box.xyxy[0])
+            detections.append((label, (x1, y1, x2, y2)))
+    return detections
+
+
+def _detect_full(model, img):
+    # Уже декодированный массив — модель не читает файл с диска повторно
+    results = model.predict(source=img, conf=CONFIDENCE_THRESHOLD, imgsz=_full_imgsz(img.shape), verbose=False)
+    return _parse_result(results[0]) if results else []
+
+
+def _touches(a, b, margin):
+    return a[0] <= b[2] + margin and b[0] <= a[2] + margin and a[1] <= b[3] + margin and b[1] <= a[3] + margin
+
+
+def _covered(part, whole):
+    iw = min(part[2], whole[2]) - max(part[0], whole[0])
+    ih = min(part[3], whole[3]) - max(part[1], whole[1])
+    area = (part[2] - part[0]) * (part[3] - part[1])
+    return iw > 0 and ih > 0 and iw * ih >= YOLO_SEAM_COVERED * area
+
+
+def _merge_seam_fragments(fragments, margin):
+    """Склеивает обрезки одного класса, соприкасающиеся через шов: [(label, box, score)] -> их объединения."""
+    parent = list(range(len(fragments)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i in range(len(fragments)):
+        for j in range(i + 1, len(fragments)):
+            if fragments[i][0] == fragments[j][0] and _touches(fragments[i][1], fragments[j][1], margin):
+                parent[find(j)] = find(i)
+
+    merged = {}
+    for i, (label, box, score) in enumerate(fragments):
+        root = find(i)
+        if root not in merged:
+            merged[root] = [label, list(box), score]
+        else:
+            m = merged[root]
+            m[1] = [min(m[1][0], box[0]), min(m[1][1], box[1]), max(m[1][2], box[2]), max(m[1][3], box[3])]
+            m[2] = max(m[2], score)
+    return [(label, tuple(box), score) for label, box, score in merged.values()]
+
+
+def _detect_tiled(model, img, tile_size, overlap):
+    h, w = img.shape[:2]
+    windows, _ = tile_windows(h, w, tile_size, overlap)
+    tile_imgsz = int((tile_size + 31) // 32 * 32)
+
+    whole, fragments = [], []
+    for b in range(0, len(windows), YOLO_TILE_BATCH):
+        batch = windows[b:b + YOLO_TILE_BATCH]
+        # Окна одной пачки уходят в модель одним вызовом
+        results = model.predict(source=[img[y0:y1, x0:x1] for x0, y0, x1, y1 in batch],
+                                conf=CONFIDENCE_THRESHOLD, imgsz=tile_imgsz, verbose=False)
+        for (x0, y0, x1, y1), res in zip(batch, results):
+            if not res.boxes: continue
+            for box in res.boxes:
+                bx1, by1, bx2, by2 = map(int, box.xyxy[0])
+                det = (res.names[int(box.cls[0])], (bx1 + x0, by1 + y0, bx2 + x0, by2 + y0), float(box.conf[0]))
+                # Бокс упирается во внутренний шов окна — это может быть лишь часть узла
+                cut = ((bx1 <= YOLO_SEAM_MARGIN and x0 > 0) or (by1 <= YOLO_SEAM_MARGIN and y0 > 0) or
+                       (bx2 >= x1 - x0 - YOLO_SEAM_MARGIN and x1 < w) or (by2 >= y1 - y0 - YOLO_SEAM_MARGIN and y1 < h))
+                (fragments if cut else whole).append(det)
+
+    # Обрезок отбрасывается, только если узел целиком нашелся в другом окне; иначе (узел крупнее перекрытия)
+    # обрезки одного класса из соседних окон склеиваются в один бокс
+    candidates = whole + [f for f in _merge_seam_fragments(fragments, YOLO_SEAM_MARGIN)
+                          if not any(lbl == f[0] and _covered(f[1], box) for lbl, box, _ in whole)]
+    if not candidates:
+        return []
+
+    # Один и тот же узел из зоны перекрытия нескольких окон — оставляем бокс с наибольшей уверенностью
+    boxes = [box for _, box, _ in candidates]
+    scores = [score for _, _, score in candidates]
+    keep = cv2.dnn.NMSBoxes([[x1, y1, x2 - x1, y2 - y1] for x1, y1, x2, y2 in boxes], scores,
+                            CONFIDENCE_THRESHOLD, YOLO_TILE_NMS_IOU)
+    keep = sorted((int(k) for k in np.array(keep).flatten()), key=lambda k: -scores[k])
+    return [(candidates[k][0], boxes[k]) for k in keep]
+
+
+def detect_nodes(img, tile_size='auto', tile_overlap=YOLO_TILE_OVERLAP, profiler=None):
+    """YOLO-детекция узлов. Возвращает [(класс, (x1, y1, x2, y2))] и боксы с отступом для OCR/очистки.
+
+    tile_size: 'auto' — окна только для больших диаграмм, None — всегда целиком, число — размер окна.
+    """
+    model = get_detector()
+    h, w = img.shape[:2]
+
+    if tile_size == 'auto':
+        tile_size = YOLO_TILE_SIZE if max(h, w) > YOLO_TILED_MIN_SIDE else None
+    with stage(profiler, "yolo_predict"):
+        if tile_size and max(h, w) > tile_size:
+            detections = _detect_tiled(model, img, tile_size, tile_overlap)
+        else:
+            detections = _detect_full(model, img)
+
+    return detections, _pad_boxes(detections, img.shape)
+
+
+def _pad_boxes(detections, shape):
+    h, w = shape[:2]
+    p = NODE_PADDING
+    return [(max(0, x1 - p), max(0, y1 - p), min(w - 1, x2 + p), min(h - 1, y2 + p))
+            for _, (x1, y1, x2, y2) in detections]
+
+
+def _batch_bucket(shape):
+    side = max(shape[:2])
+    return next((b for b in YOLO_BATCH_BUCKETS if b >= side), None)
+
+
+def detect_nodes_batch(imgs, profiler=None):
+    """detect_nodes для нескольких изображений с общими вызовами predict.
+
+    Изображения группируются по корзинам YOLO_BATCH_BUCKETS (letterbox к общему imgsz), поэтому результат
+    может немного отличаться от detect_nodes; крупные диаграммы, требующие окон, обрабатываются по одной.
+    """
+    model = get_detector()
+    out = [None] * len(imgs)
+    groups = {}
+    for k, img in enumerate(imgs):
+        bucket = _batch_bucket(img.shape)
+        if bucket is None or max(img.shape[:2]) > YOLO_TILED_MIN_SIDE:
+            out[k] = detect_nodes(img, profiler=profiler)
+        else:
+            groups.setdefault(bucket, []).append(k)
+
+    for imgsz, idxs in groups.items():
+        with stage(profiler, "yolo_predict"):
+            results = model.predict(source=[imgs[k] for k in idxs], conf=CONFIDENCE_THRESHOLD, imgsz=imgsz,
+                                    verbose=False)
+        for k, result in zip(idxs, results):
+            detections = _parse_result(result)
+            out[k] = (detections, _pad_boxes(detections, imgs[k].shape))
+    return out
+
+
+def build_nodes_data(detections, node_texts):
+    nodes_data = []
+    for i, (label, (x1, y1, x2, y2)) in enumerate(detections):
+        # Расчет нового формата (Центр + Размеры)
+        nodes_data.append({
+            "id": f"n{i}",
+            "type": label,
+            "txt": simple_text_clean(node_texts[i]),
+            "cnt": [int((x1 + x2) / 2), int((y1 + y2) / 2)],
+            "wh": [x2 - x1, y2 - y1]
+        })
+    return nodes_data
+
+
+def erase_nodes(img, padded_boxes):
+    clean_img = img.copy()
+    for x1_p, y1_p, x2_p, y2_p in padded_boxes:
+        cv2.rectangle(clean_img, (x1_p, y1_p), (x2_p, y2_p), (255, 255, 255), -1)
+    return clean_img
+
+
+def predict_and_show(image_input, ocr_mode=NODE_OCR_MODE, debug_dir=None, profiler=None, detection=None):
+    """image_input — путь или уже декодированное BGR-изображение (не изменяется).
+
+    Отладочные картинки пишутся только при заданном debug_dir.
+    detection — уже готовый результат detect_nodes (например, из пакетной детекции сервиса).
+    """
+    if isinstance(image_input, str):
+        if not os.path.exists(image_input):
+            return [], None
+        img = cv2.imread(image_input)
+    else:
+        img = image_input
+    if img is None: return [], None
+
+    detections, padded_boxes = detection if detection is not None else detect_nodes(img, profiler=profiler)
+
+    # OCR ВНУТРИ УЗЛОВ
+    if not detections:
+        node_texts = []
+    else:
+        plan = node_ocr_plan(img, detections, profiler=profiler)
+        if ocr_mode == 'per_node':
+            node_texts = _ocr_per_node(img, padded_boxes, get_ocr(NODE_OCR_CONFIG), plan, profiler=profiler)
+        else:
+            node_texts = _ocr_batched(img, padded_boxes, plan, profiler=profiler)
+
+    nodes_data = build_nodes_data(detections, node_texts)
+    clean_img = erase_nodes(img, padded_boxes)
 
-            # Расчет нового формата (Центр + Размеры)
-            center_x = int((x1 + x2) / 2)
-            center_y = int((y1 + y2) / 2)
-            width = x2 - x1
-            height = y2 - y1
-
-            # OCR ВНУТРИ УЗЛА
-            x1_p, y1_p = max(0, x1 - p), max(0, y1 - p)
-            x2_p, y2_p = min(w - 1, x2 + p), min(h - 1, y2 + p)
-            node_crop = img[y1_p:y2_p, x1_p:x2_p]
-
-            node_text = ""
-            if node_crop.size > 0:
-                crop_res = cv2.resize(node_crop, (0, 0), fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-                ocr_res = ocr_local.ocr(crop_res, cls=True)
-                if ocr_res and ocr_res[0]:
-                    node_text = " ".join([line[1][0] for line in ocr_res[0]])
-
-            node_text = simple_text_clean(node_text)
-
-            nodes_data.append({
-                "id": f"n{i}",
-                "type": label,
-                "txt": node_text,
-                "cnt": [center_x, center_y],
-                "wh": [width, height]
-            })
-
-            # Отрисовка дебага
+    if debug_dir:
+        # Отрисовка дебага
+        debug_img = img.copy()
+        for _, (x1, y1, x2, y2) in detections:
             cv2.rectangle(debug_img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.rectangle(clean_img, (x1_p, y1_p), (x2_p, y2_p), (255, 255, 255), -1)
 
-    os.makedirs(CLEAN_DIR, exist_ok=True)
-    cv2.imwrite(os.path.join(CLEAN_DIR, "0_debug.png"), debug_img)
-    cv2.imwrite(os.path.join(CLEAN_DIR, "1_nodes_removed.png"), clean_img)
+        os.makedirs(debug_dir, exist_ok=True)
+        cv2.imwrite(os.path.join(debug_dir, "0_debug.png"), debug_img)
+        cv2.imwrite(os.path.join(debug_dir, "1_nodes_removed.png"), clean_img)
 
-    return nodes_data, clean_img
\ No newline at end of file
+    return nodes_data, clean_img
@@ -0,0 +1,44 @@
+# Разбиение большого изображения на перекрывающиеся окна для OCR/YOLO по частям.
+
+
+def axis_starts(length, tile_size, overlap):
+    """Начала окон по одной оси: шаг tile_size - overlap, последнее окно прижато к краю."""
+    if length <= tile_size:
+        return [0]
+    step = max(tile_size - overlap, 1)
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def _axis_cores(length, starts, tile_size):
+    # Граница "владения" между соседними окнами — середина их перекрытия
+    ends = [min(s + tile_size, length) for s in starts]
+    cores = []
+    for k, (s, e) in enumerate(zip(starts, ends)):
+        lo = float('-inf') if k == 0 else (s + ends[k - 1]) / 2
+        hi = float('inf') if k == len(starts) - 1 else (starts[k + 1] + e) / 2
+        cores.append((lo, hi))
+    return list(zip(starts, ends)), cores
+
+
+def tile_windows(h, w, tile_size, overlap):
+    """Окна [(x0, y0, x1, y1)] и их зоны владения [(cx0, cy0, cx1, cy1)].
+
+    Зоны владения не пересекаются и покрывают все изображение: объект, найденный в нескольких окнах,
+    оставляют только в том окне, в чью зону попал его центр.
+    """
+    xs, x_cores = _axis_cores(w, axis_starts(w, tile_size, overlap), tile_size)
+    ys, y_cores = _axis_cores(h, axis_starts(h, tile_size, overlap), tile_size)
+
+    windows, cores = [], []
+    for (y0, y1), (cy0, cy1) in zip(ys, y_cores):
+        for (x0, x1), (cx0, cx1) in zip(xs, x_cores):
+            windows.append((x0, y0, x1, y1))
+            cores.append((cx0, cy0, cx1, cy1))
+    return windows, cores
+
+
+def in_core(cx, cy, core):
+    cx0, cy0, cx1, cy1 = core
+    return cx0 <= cx < cx1 and cy0 <= cy < cy1
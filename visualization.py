@@ -1,65 +1,185 @@
 import cv2
 import os
+import json
+import random
+import hashlib
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 # Список классов должен СТРОГО совпадать с твоим основным скриптом
 CLASSES = ['Task', 'Gateway', 'StartEvent', 'EndEvent', 'IntermediateEvent']
 # Цвета для классов (BGR): Задачи - синий, Шлюзы - зеленый, События - красный/желтый
 COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (0, 165, 255), (255, 0, 255)]
 
+# Параметры проверки больших датасетов
+QA_WORKERS = os.cpu_count() or 1
+THUMB_SIZE = 320         # Сторона миниатюры на контактном листе
+SHEET_GRID = (8, 8)      # Миниатюр на листе: столбцы x строки
+SAMPLE_SEED = 0
+QA_STATE_NAME = '.qa_state.json'  # Хеши разметки на момент прошлой проверки (для --changed-only)
 
-def draw_yolo_labels(folder_path, output_folder):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    for file in os.listdir(folder_path):
-        if not file.endswith('.png'):
-            continue
-
-        base_name = os.path.splitext(file)[0]
-        txt_path = os.path.join(folder_path, base_name + '.txt')
-        img_path = os.path.join(folder_path, file)
-
-        if not os.path.exists(txt_path):
-            continue
-
-        # Читаем картинку
-        img = cv2.imread(img_path)
-        h, w, _ = img.shape
 
-        with open(txt_path, 'r') as f:
-            lines = f.readlines()
-
-        for line in lines:
+def read_yolo_labels(txt_path):
+    labels = []
+    with open(txt_path, 'r') as f:
+        for line in f:
             parts = line.strip().split()
             if len(parts) != 5: continue
+            # YOLO format: cls, cx, cy, nw, nh (normalized)
+            labels.append((int(parts[0]),) + tuple(map(float, parts[1:])))
+    return labels
+
+
+def draw_labels(img, labels, thickness=2, font_scale=0.5):
+    """Рисует рамки и имена классов на img (на месте)."""
+    h, w = img.shape[:2]
+    for cls_id, cx, cy, nw, nh in labels:
+        # Пересчитываем в пиксели
+        x1 = int((cx - nw / 2) * w)
+        y1 = int((cy - nh / 2) * h)
+        x2 = int((cx + nw / 2) * w)
+        y2 = int((cy + nh / 2) * h)
+
+        # Рисуем рамку
+        color = COLORS[cls_id] if cls_id < len(COLORS) else (0, 255, 255)
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, thickness)
+
+        # Пишем текст
+        if font_scale:
+            label = CLASSES[cls_id] if cls_id < len(CLASSES) else str(cls_id)
+            cv2.putText(img, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
+    return img
+
+
+def _label_pairs(folder_path):
+    pairs = []
+    for file in sorted(os.listdir(folder_path)):
+        if not file.endswith('.png'):
+            continue
+        txt_path = os.path.join(folder_path, os.path.splitext(file)[0] + '.txt')
+        if os.path.exists(txt_path):
+            pairs.append((os.path.join(folder_path, file), txt_path))
+    return pairs
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _check_full(img_path, txt_path, output_folder):
+    img = cv2.imread(img_path)
+    if img is None:
+        return None
+    draw_labels(img, read_yolo_labels(txt_path))
+    save_path = os.path.join(output_folder, f"check_{os.path.basename(img_path)}")
+    cv2.imwrite(save_path, img)
+    return save_path
+
+
+def _check_thumb(img_path, txt_path, thumb_size):
+    """Миниатюра с рамками: сначала уменьшаем, потом рисуем — тонкие рамки не теряются при сжатии."""
+    img = cv2.imread(img_path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    k = thumb_size / max(h, w)
+    thumb = cv2.resize(img, (max(1, int(w * k)), max(1, int(h * k))), interpolation=cv2.INTER_AREA)
+    draw_labels(thumb, read_yolo_labels(txt_path), thickness=1, font_scale=0)
+
+    cell = np.full((thumb_size + 16, thumb_size, 3), 255, dtype=np.uint8)
+    cell[:thumb.shape[0], :thumb.shape[1]] = thumb
+    cv2.putText(cell, os.path.basename(img_path)[:40], (2, thumb_size + 12),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0, 0, 0), 1)
+    return cell
+
+
+def _write_sheet(chunk, index, output_folder, grid):
+    cols, rows = grid
+    ch, cw = chunk[0].shape[:2]
+    used_rows = (len(chunk) + cols - 1) // cols
+    sheet = np.full((ch * used_rows, cw * cols, 3), 200, dtype=np.uint8)
+    for k, cell in enumerate(chunk):
+        r, c = divmod(k, cols)
+        sheet[r * ch:(r + 1) * ch, c * cw:(c + 1) * cw] = cell
+    path = os.path.join(output_folder, f"sheet_{index:04d}.jpg")
+    cv2.imwrite(path, sheet, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return path
+
+
+def _check_sheet(pairs, index, output_folder, thumb_size, grid=SHEET_GRID):
+    """Один контактный лист целиком в воркере: в памяти процесса не больше одного листа."""
+    cells = [c for c in (_check_thumb(img, txt, thumb_size) for img, txt in pairs) if c is not None]
+    return _write_sheet(cells, index, output_folder, grid) if cells else None
+
+
+def draw_yolo_labels(folder_path, output_folder, workers=1, sample=None, changed_only=False,
+                     mosaic=False, seed=SAMPLE_SEED, thumb_size=THUMB_SIZE):
+    """Наложение разметки для визуальной проверки.
+
+    sample — проверить только N случайных пар (воспроизводимо по seed);
+    changed_only — только пары, чья разметка изменилась с прошлой проверки в этой output_folder;
+    mosaic — вместо полноразмерных check_*.png писать контактные листы из миниатюр.
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
 
-            cls_id = int(parts[0])
-            # YOLO format: cx, cy, nw, nh (normalized)
-            cx, cy, nw, nh = map(float, parts[1:])
-
-            # Пересчитываем в пиксели
-            x1 = int((cx - nw / 2) * w)
-            y1 = int((cy - nh / 2) * h)
-            x2 = int((cx + nw / 2) * w)
-            y2 = int((cy + nh / 2) * h)
-
-            # Рисуем рамку
-            color = COLORS[cls_id] if cls_id < len(COLORS) else (0, 255, 255)
-            cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
-
-            # Пишем текст
-            label = f"{CLASSES[cls_id]}"
-            cv2.putText(img, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-        # Сохраняем результат
-        save_path = os.path.join(output_folder, f"check_{file}")
-        cv2.imwrite(save_path, img)
-        print(f"📸 Проверка готова: {save_path}")
+    pairs = _label_pairs(folder_path)
+
+    state_path = os.path.join(output_folder, QA_STATE_NAME)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    hashes = {}
+    if changed_only:
+        hashes = {txt: _file_hash(txt) for _, txt in pairs}
+        pairs = [(img, txt) for img, txt in pairs if state.get(os.path.basename(txt)) != hashes[txt]]
+
+    if sample is not None and sample < len(pairs):
+        pairs = sorted(random.Random(seed).sample(pairs, sample))
+
+    if not pairs:
+        print("ℹ️  Нечего проверять")
+        return []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if mosaic:
+            per_sheet = SHEET_GRID[0] * SHEET_GRID[1]
+            chunks = [pairs[i:i + per_sheet] for i in range(0, len(pairs), per_sheet)]
+            sheets = pool.map(_check_sheet, chunks, range(len(chunks)), [output_folder] * len(chunks),
+                              [thumb_size] * len(chunks))
+            results = [p for p in sheets if p is not None]
+        else:
+            saved = pool.map(_check_full, *zip(*pairs), [output_folder] * len(pairs), chunksize=16)
+            results = [p for p in saved if p is not None]
+
+    # Запоминаем проверенную разметку, чтобы следующий --changed-only показал только новое
+    for _, txt in pairs:
+        state[os.path.basename(txt)] = hashes.get(txt) or _file_hash(txt)
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+    print(f"📸 Проверено {len(pairs)} изображений, записано файлов: {len(results)} в {output_folder}")
+    return results
 
 
 if __name__ == "__main__":
     # Укажи путь к папке, где лежат твои сгенерированные .png и .txt
     input_dir = r'C:\Users\VelmorSDFG\PycharmProjects\BPMN\uploads\raw\bpmn\02-Results'
-    output_dir = os.path.join(input_dir, 'debug_view')
 
-    draw_yolo_labels(input_dir, output_dir)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Визуальная проверка разметки YOLO")
+    parser.add_argument('folder', nargs='?', default=input_dir)
+    parser.add_argument('--out', default=None, help="Папка результата (по умолчанию <folder>/debug_view)")
+    parser.add_argument('--workers', type=int, default=QA_WORKERS)
+    parser.add_argument('--sample', type=int, default=None, help="Проверить N случайных изображений")
+    parser.add_argument('--seed', type=int, default=SAMPLE_SEED)
+    parser.add_argument('--changed-only', action='store_true', help="Только изменившаяся с прошлой проверки разметка")
+    parser.add_argument('--mosaic', action='store_true', help="Контактные листы вместо полноразмерных копий")
+    parser.add_argument('--thumb', type=int, default=THUMB_SIZE, help="Размер миниатюры на листе")
+    args = parser.parse_args()
+
+    output_dir = args.out or os.path.join(args.folder, 'debug_view')
+    draw_yolo_labels(args.folder, output_dir, workers=args.workers, sample=args.sample,
+                     changed_only=args.changed_only, mosaic=args.mosaic, seed=args.seed, thumb_size=args.thumb)